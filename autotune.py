@@ -0,0 +1,74 @@
+import json
+import os
+import platform
+import time
+
+
+def thread_counts():
+    counts = [0]
+    threads = 2
+    while threads <= (os.cpu_count() or 1):
+        counts.append(threads)
+        threads *= 2
+    if (os.cpu_count() or 1) > 1 and counts[-1] != os.cpu_count():
+        counts.append(os.cpu_count())
+    return counts
+
+
+def measure(build, simulation_type, simulation_threads, tile_size, steps):
+    simulation = build(simulation_type, simulation_threads, tile_size)
+    simulation.iterate()
+    start = time.perf_counter()
+    for _ in range(steps):
+        simulation.iterate()
+    return (time.perf_counter() - start) / steps
+
+
+def calibrate(build, steps=5, tile_sizes=(0, 32, 64, 128)):
+    """
+    times the numpy engine and the cpu engine over its thread counts, then the tile sizes for
+    the fastest thread count, returns the fastest (simulation_type, simulation_threads, tile_size)
+    """
+    timings = {("numpy", 0, 0): measure(build, "numpy", 0, 0, steps)}
+
+    default_tile_size = tile_sizes[len(tile_sizes) // 2]
+    for simulation_threads in thread_counts():
+        timings[("cpu", simulation_threads, default_tile_size)] = measure(build, "cpu", simulation_threads,
+                                                                          default_tile_size, steps)
+    best_threads = min((choice for choice in timings if choice[0] == "cpu"), key=timings.get)[1]
+
+    for tile_size in tile_sizes:
+        if ("cpu", best_threads, tile_size) not in timings:
+            timings[("cpu", best_threads, tile_size)] = measure(build, "cpu", best_threads, tile_size, steps)
+
+    return min(timings, key=timings.get), timings
+
+
+def tune(build, key: dict, cache_path: str = "~/.cache/physarum/autotune.json", steps: int = 5):
+    """
+    build(simulation_type, simulation_threads, tile_size) has to return a ready simulation,
+    the choice is cached per host, cpu count and key so calibration runs only once
+    """
+    cache_path = os.path.expanduser(cache_path)
+    cache_key = f"{platform.node()}|{os.cpu_count()}|{json.dumps(key, sort_keys=True)}"
+
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r') as file:
+            cache = json.load(file)
+    if cache_key in cache:
+        choice = cache[cache_key]
+        return choice["simulation_type"], choice["simulation_threads"], choice["tile_size"]
+
+    (simulation_type, simulation_threads, tile_size), timings = calibrate(build, steps)
+    print(f"autotune: {simulation_type}  threads: {simulation_threads}  tile size: {tile_size}  "
+          f"step: {round(timings[(simulation_type, simulation_threads, tile_size)] * 1000, 2)} ms")
+
+    cache[cache_key] = {"simulation_type": simulation_type,
+                        "simulation_threads": simulation_threads,
+                        "tile_size": tile_size}
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    with open(cache_path, 'w') as file:
+        json.dump(cache, file, indent=4)
+
+    return simulation_type, simulation_threads, tile_size
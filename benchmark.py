@@ -0,0 +1,182 @@
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+
+import numba
+import numpy as np
+
+from simulation_cpu import (Physarum, build_direction_tables, box_blur, deposit, deposit_add, deposit_add_parallel,
+                            diffuse_evaporate_tiled, evaporate, seed_streams, sort_cells_spatially, step_agents,
+                            tile_scratch)
+
+
+def measure(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def benchmark_case(resolution, cells, trail_decay_factor, steps, simulation_threads, tile_size):
+    simulation = Physarum(resolution, resolution, resolution // 4, cells, 0, trail_decay_factor, 5,
+                          3, 1, 30, 1, 55, simulation_threads, 1, "box", 1.0, tile_size)
+    simulation.iterate()
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        simulation.iterate()
+    step_time = (time.perf_counter() - start) / steps
+
+    # every phase on its own, on a copy of the state the simulation reached
+    matrix = simulation.get_matrix().copy()
+    back_matrix = np.zeros_like(matrix)
+    row_sums = np.zeros(matrix.shape, dtype=np.int32)
+    column_sums = np.zeros(matrix.shape[1], dtype=np.int32)
+    cells_array = simulation.get_cells_array().copy()
+    rng_states = seed_streams(1, max(simulation_threads, 1))
+    sensor_offsets, movement_offsets = build_direction_tables(3, 30, 1)
+
+    phases = {
+        "agents": measure(lambda: step_agents(matrix, cells_array, cells, rng_states, resolution, resolution,
+                                              3, 1, sensor_offsets, movement_offsets, 55), steps),
+        "deposit": measure(lambda: deposit(matrix, cells_array, cells), steps),
+        "deposit_add": measure(lambda: deposit_add(matrix, cells_array, cells, 16), steps),
+        "evaporate": measure(lambda: evaporate(matrix, 5), steps),
+        "diffuse": measure(lambda: box_blur(matrix, back_matrix, row_sums, column_sums, trail_decay_factor), steps),
+    }
+    # the engine only counts hits in per thread grids once the cells cover half the matrix
+    if cells >= matrix.size // 2:
+        deposit_partials = np.zeros((numba.get_num_threads(),) + matrix.shape, dtype=np.uint8)
+        phases["deposit_add_parallel"] = measure(
+            lambda: deposit_add_parallel(matrix, cells_array, cells, 16, deposit_partials), steps)
+    if tile_size > 0:
+        tile_row_sums, tile_column_sums = tile_scratch(tile_size, trail_decay_factor)
+        phases["diffuse_evaporate_tiled"] = measure(
+            lambda: diffuse_evaporate_tiled(matrix, back_matrix, trail_decay_factor, 5, tile_size, tile_row_sums,
+                                            tile_column_sums), steps)
+
+    return {
+        "resolution": resolution,
+        "cells": cells,
+        "trail_decay_factor": trail_decay_factor,
+        "step_time": step_time,
+        "steps_per_second": 1.0 / step_time,
+        "phases": phases,
+    }
+
+
+def sorting_case(resolution, cells, steps, simulation_threads):
+    """
+    agents and deposit on cells in spawn order and on the same cells sorted along the morton curve,
+    the spawn order is random over the matrix so every agent touches a different cache line
+    """
+    simulation = Physarum(resolution, resolution, resolution // 2, cells, 0, 3, 5,
+                          3, 1, 30, 1, 55, simulation_threads, 1)
+    matrix = simulation.get_matrix().copy()
+    rng_states = seed_streams(1, max(simulation_threads, 1))
+    sensor_offsets, movement_offsets = build_direction_tables(3, 30, 1)
+    scratch = np.empty((3, cells), dtype=np.int32)
+    order = np.empty(cells, dtype=np.uint64)
+    scratch_order = np.empty(cells, dtype=np.uint64)
+
+    def frame(cells_array):
+        step_agents(matrix, cells_array, cells, rng_states, resolution, resolution,
+                    3, 1, sensor_offsets, movement_offsets, 55)
+        deposit(matrix, cells_array, cells)
+
+    unsorted_cells = simulation.get_cells_array().copy()
+    sorted_cells = unsorted_cells.copy()
+    sort_cells_spatially(sorted_cells, cells, scratch, order, scratch_order)
+    unsorted_time = measure(lambda: frame(unsorted_cells), steps)
+    sorted_time = measure(lambda: frame(sorted_cells), steps)
+    sort_time = measure(lambda: sort_cells_spatially(sorted_cells, cells, scratch, order, scratch_order), steps)
+
+    return {
+        "resolution": resolution,
+        "cells": cells,
+        "unsorted_frame_time": unsorted_time,
+        "sorted_frame_time": sorted_time,
+        "sort_time": sort_time,
+        "speedup": unsorted_time / sorted_time,
+    }
+
+
+def case_key(result):
+    return result["resolution"], result["cells"], result["trail_decay_factor"]
+
+
+def compare(results, baseline, threshold):
+    baseline_results = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        reference = baseline_results.get(case_key(result))
+        if reference is None:
+            continue
+        ratio = result["steps_per_second"] / reference["steps_per_second"]
+        if ratio < 1 - threshold:
+            regressions.append({"case": dict(zip(("resolution", "cells", "trail_decay_factor"), case_key(result))),
+                                "baseline_steps_per_second": reference["steps_per_second"],
+                                "steps_per_second": result["steps_per_second"],
+                                "ratio": ratio})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the cpu simulation")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[256, 1024, 4096])
+    parser.add_argument("--cells", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--decay", type=int, nargs="+", default=[3, 9], help="trail_decay_factor values")
+    parser.add_argument("--steps", type=int, default=10, help="timed iterations per case")
+    parser.add_argument("--threads", type=int, default=0, help="simulation_threads")
+    parser.add_argument("--tile-size", type=int, default=64, help="tile_size, 0 for separate passes")
+    parser.add_argument("--output", default=None, help="write the json report here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="json report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed relative drop in steps/s before the comparison fails")
+    parser.add_argument("--sorting", action="store_true",
+                        help="also compare agents and deposit on unsorted and spatially sorted cells")
+    args = parser.parse_args()
+
+    results = []
+    for resolution, cells, decay in itertools.product(args.resolutions, args.cells, args.decay):
+        result = benchmark_case(resolution, cells, decay, args.steps, args.threads, args.tile_size)
+        results.append(result)
+        print(f"{resolution}x{resolution}  cells: {cells}  decay: {decay}  "
+              f"steps/s: {round(result['steps_per_second'], 2)}", file=sys.stderr)
+
+    report = {
+        "host": platform.node(),
+        "processor": platform.processor(),
+        "threads": args.threads,
+        "tile_size": args.tile_size,
+        "results": results,
+    }
+
+    if args.sorting:
+        report["sorting"] = []
+        for resolution, cells in itertools.product(args.resolutions, args.cells):
+            result = sorting_case(resolution, cells, args.steps, args.threads)
+            report["sorting"].append(result)
+            print(f"{resolution}x{resolution}  cells: {cells}  sorted speedup: {round(result['speedup'], 2)}  "
+                  f"sort: {round(result['sort_time'] * 1000, 2)} ms", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            report["regressions"] = compare(results, json.load(file), args.threshold)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+    if report.get("regressions"):
+        for regression in report["regressions"]:
+            print(f"regression: {regression['case']}  {round(regression['baseline_steps_per_second'], 2)} -> "
+                  f"{round(regression['steps_per_second'], 2)} steps/s", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,30 @@
+"""
+a checkpoint is a directory with one uncompressed .npy file per array and a state.json
+with everything else, arrays can be opened memory mapped with read_checkpoint(path, mmap=True)
+"""
+import json
+import os
+
+import numpy as np
+
+
+def write_checkpoint(path: str, arrays: dict, state: dict):
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array, allow_pickle=False)
+    state = dict(state, arrays=sorted(arrays))
+    with open(os.path.join(path, "state.json"), 'w') as file:
+        json.dump(state, file, indent=4)
+
+
+def read_checkpoint(path: str, mmap: bool = True, engine: str = None):
+    """
+    raises ValueError when engine is given and the checkpoint was written by another engine
+    """
+    with open(os.path.join(path, "state.json"), 'r') as file:
+        state = json.load(file)
+    if engine is not None and state.get("engine") != engine:
+        raise ValueError(f"{path} is a {state.get('engine')} checkpoint, not {engine}")
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None, allow_pickle=False)
+              for name in state.pop("arrays")}
+    return arrays, state
@@ -0,0 +1,45 @@
+"""
+the color settings compiled into a 256x3 uint8 lookup table, a trail matrix is turned into rgb
+with a single gather lut[matrix], the same table colors the display and the recorded frames
+"""
+import numpy as np
+
+COLOR_SETTINGS = ("low_threshold", "high_threshold", "low_red", "low_green", "low_blue",
+                  "high_red", "high_green", "high_blue")
+
+
+def build_lut(low_threshold, high_threshold, low_red, low_green, low_blue, high_red, high_green, high_blue):
+    """
+    thresholds in % of the trail range, colors 0-255. every channel is 0 up to low_threshold and ramps
+    linearly to its level at high_threshold, the level is (high_threshold - low_threshold) / (high - low)
+    with thresholds and colors divided by 100, clipped to 0-1
+    """
+    low_threshold = low_threshold / 100
+    high_threshold = high_threshold / 100
+    high_threshold = low_threshold + 1 if high_threshold <= low_threshold else high_threshold
+
+    levels = []
+    for low, high in ((low_red, high_red), (low_green, high_green), (low_blue, high_blue)):
+        low = low / 100
+        high = high / 100
+        low = high - 1 if low >= high else low
+        high = low + 1 if high <= low else high
+        levels.append((high_threshold - low_threshold) / (high - low))
+
+    values = np.linspace(0, 1, 256)
+    lut = np.empty((256, 3), dtype=np.uint8)
+    for channel, level in enumerate(levels):
+        ramp = np.interp(values, [0, low_threshold, high_threshold], [0, 0, level])
+        lut[:, channel] = np.round(np.clip(ramp, 0, 1) * 255)
+    return lut
+
+
+def lut_from_config(data_accessor):
+    return build_lut(*(data_accessor.get_parameter("color_settings", name) for name in COLOR_SETTINGS))
+
+
+def apply_lut(matrix, lut, out=None):
+    """
+    (H, W) uint8 matrix to (H, W, 3) rgb, out is reused when given
+    """
+    return np.take(lut, matrix, axis=0, out=out)
@@ -12,10 +12,15 @@ class DataAccessor:
             config = file.read()
             return config
 
-    def get_parameter(self, *args):
+    def get_parameter(self, *args, **kwargs):
         part = json.loads(self.__config)
-        for arg in args:
-            part = part[arg]
+        try:
+            for arg in args:
+                part = part[arg]
+        except KeyError:
+            if "default" in kwargs:
+                return kwargs["default"]
+            raise
         return part["value"]
 
     def get_config(self):
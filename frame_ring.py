@@ -0,0 +1,147 @@
+"""
+a ring of frame slots in multiprocessing.shared_memory, written by the running simulation and read by
+any number of other processes (recorders, analysis jobs, viewers) without copies or pickling.
+
+layout, all header fields int64:
+    ring header     magic, slots, slot height, slot width, newest frame number (-1 before the first)
+    slot header     sequence, frame number, height, width, cells amount    (one per slot)
+    slot data       height * width uint8                                   (one per slot)
+
+frame n goes into slot n % slots. the sequence of a slot is odd while the writer fills it, a reader
+checks that it is even and unchanged after reading, otherwise the slot was overwritten meanwhile.
+readers always jump to the newest frame, so a slow reader skips frames instead of holding up the writer.
+"""
+import argparse
+import time
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAGIC = 0x50485953
+RING_HEADER = 5
+SLOT_HEADER = 5
+
+Frame = namedtuple("Frame", ["number", "cells_amount", "matrix", "slot", "sequence"])
+
+
+def _layout(buffer, slots, height, width):
+    header = np.ndarray((RING_HEADER,), dtype=np.int64, buffer=buffer)
+    slot_headers = np.ndarray((slots, SLOT_HEADER), dtype=np.int64, buffer=buffer, offset=RING_HEADER * 8)
+    data = np.ndarray((slots, height * width), dtype=np.uint8, buffer=buffer,
+                      offset=(RING_HEADER + slots * SLOT_HEADER) * 8)
+    return header, slot_headers, data
+
+
+class FrameRingWriter:
+    def __init__(self, name: str, height: int, width: int, slots: int = 8):
+        """
+        creates the ring, frames up to height x width fit into a slot, larger ones are skipped
+        """
+        self.name = name
+        self.slots = slots
+        self.skipped_frames = 0
+        size = (RING_HEADER + slots * SLOT_HEADER) * 8 + slots * height * width
+        self.__memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.__header, self.__slot_headers, self.__data = _layout(self.__memory.buf, slots, height, width)
+        self.__slot_headers[:] = 0
+        self.__header[:] = (MAGIC, slots, height, width, -1)
+
+    def publish(self, matrix, frame_number: int, cells_amount: int = 0):
+        height, width = matrix.shape
+        if height * width > self.__data.shape[1]:
+            self.skipped_frames += 1
+            return False
+        slot = frame_number % self.slots
+        slot_header = self.__slot_headers[slot]
+        slot_header[0] += 1
+        self.__data[slot, :height * width].reshape(height, width)[:] = matrix
+        slot_header[1:] = (frame_number, height, width, cells_amount)
+        slot_header[0] += 1
+        self.__header[4] = frame_number
+        return True
+
+    def close(self):
+        del self.__header, self.__slot_headers, self.__data
+        self.__memory.close()
+        self.__memory.unlink()
+
+
+class FrameRingReader:
+    def __init__(self, name: str):
+        """
+        attaches to a ring created by FrameRingWriter, the ring stays owned by the writer
+        """
+        self.__memory = shared_memory.SharedMemory(name=name)
+        # attaching registers the block for cleanup by this process, which would unlink the writer's ring
+        resource_tracker.unregister(self.__memory._name, "shared_memory")
+        header = np.ndarray((RING_HEADER,), dtype=np.int64, buffer=self.__memory.buf)
+        if header[0] != MAGIC:
+            raise ValueError(f"{name} is not a frame ring")
+        self.slots, height, width = (int(value) for value in header[1:4])
+        self.__header, self.__slot_headers, self.__data = _layout(self.__memory.buf, self.slots, height, width)
+        self.last_frame = -1
+        self.skipped_frames = 0
+
+    def newest(self):
+        """
+        the newest frame as a view into the ring, None if nothing new was published since the last call.
+        the view stays valid while valid(frame) is true, use copy() for a frame that can be kept
+        """
+        number = int(self.__header[4])
+        if number <= self.last_frame:
+            return None
+        slot = number % self.slots
+        sequence, frame_number, height, width, cells_amount = (int(value) for value in self.__slot_headers[slot])
+        if sequence % 2 or frame_number != number:
+            return None
+        if self.last_frame >= 0:
+            self.skipped_frames += number - self.last_frame - 1
+        self.last_frame = number
+        return Frame(number, cells_amount, self.__data[slot, :height * width].reshape(height, width), slot, sequence)
+
+    def valid(self, frame: Frame):
+        return self.__slot_headers[frame.slot, 0] == frame.sequence
+
+    def copy(self, frame: Frame):
+        """
+        a private copy of the frame, None if the writer overwrote the slot while copying
+        """
+        matrix = frame.matrix.copy()
+        return matrix if self.valid(frame) else None
+
+    def wait(self, timeout: float = None, interval: float = 0.001):
+        """
+        blocks until a new frame is published, None on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frame = self.newest()
+            if frame is not None:
+                return frame
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(interval)
+
+    def close(self):
+        del self.__header, self.__slot_headers, self.__data
+        self.__memory.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="follow the frames of a running simulation")
+    parser.add_argument("name", help="name of the frame ring, program_settings.publish_ring")
+    parser.add_argument("--frames", type=int, default=0, help="stop after n frames, 0 never")
+    args = parser.parse_args()
+
+    reader = FrameRingReader(args.name)
+    received = 0
+    while args.frames == 0 or received < args.frames:
+        frame = reader.wait()
+        matrix = reader.copy(frame)
+        if matrix is None:
+            continue
+        received += 1
+        print(f"frame: {frame.number}  cells: {frame.cells_amount}  mean trail: {round(float(matrix.mean()), 3)}  "
+              f"skipped: {reader.skipped_frames}")
+    reader.close()
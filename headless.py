@@ -0,0 +1,98 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+import interfaces
+from colormap import apply_lut, lut_from_config
+from config import DataAccessor
+from frame_ring import FrameRingWriter
+from loader import load_class
+
+
+def save_frame(matrix, dump_dir, iteration, dump_format, lut=None):
+    if lut is not None:
+        matrix = apply_lut(matrix, lut)
+    path = os.path.join(dump_dir, f"frame_{str(iteration).zfill(5)}.{dump_format}")
+    if dump_format == "npy":
+        np.save(path, matrix)
+    else:
+        from PIL import Image
+        Image.fromarray(matrix).save(path)
+
+
+def run(data_accessor: DataAccessor, iterations: int, dump_every: int = 0, dump_dir: str = "frames",
+        dump_format: str = "png", stats_every: int = 0, checkpoint_every: int = 0,
+        checkpoint_dir: str = "checkpoints", resume: str = None, color: bool = False):
+    start = time.time()
+    simulation = load_class(data_accessor)
+    if checkpoint_every > 0 and type(simulation).save_checkpoint is interfaces.Physarum.save_checkpoint:
+        raise SystemExit(f"{type(simulation).__module__} does not support checkpoints, drop --checkpoint-every")
+    resumed = 0
+    if resume:
+        # the constructor runs one iteration the loop does not count, the numbering continues after the checkpoint
+        resumed = max(simulation.load_checkpoint(resume) - 1, 0)
+    setup_time = time.time() - start
+
+    if dump_every > 0:
+        os.makedirs(dump_dir, exist_ok=True)
+    lut = lut_from_config(data_accessor) if color else None
+
+    ring = None
+    publish_ring = data_accessor.get_parameter("program_settings", "publish_ring", default="")
+    if publish_ring:
+        height, width = simulation.get_matrix().shape
+        ring = FrameRingWriter(publish_ring, height, width,
+                               data_accessor.get_parameter("program_settings", "publish_slots", default=8))
+
+    cell_steps = 0
+    start = time.time()
+    for step in range(1, iterations + 1):
+        iteration = resumed + step
+        simulation.iterate()
+        cell_steps += simulation.get_cells_amount()
+        if ring is not None:
+            ring.publish(simulation.get_matrix(), iteration, simulation.get_cells_amount())
+
+        if stats_every > 0 and iteration % stats_every == 0:
+            elapsed = time.time() - start
+            print(f"iteration: {iteration}  cells: {simulation.get_cells_amount()}  "
+                  f"mean trail: {round(float(simulation.get_matrix().mean()), 3)}  "
+                  f"steps/s: {round(step / max(elapsed, 1e-9), 2)}")
+
+        if dump_every > 0 and iteration % dump_every == 0:
+            save_frame(simulation.get_matrix(), dump_dir, iteration, dump_format, lut)
+
+        if checkpoint_every > 0 and iteration % checkpoint_every == 0:
+            simulation.save_checkpoint(os.path.join(checkpoint_dir, f"iteration_{str(iteration).zfill(5)}"))
+    elapsed = time.time() - start
+    if ring is not None:
+        ring.close()
+
+    print(f"setup: {round(setup_time, 2)}s")
+    print(f"{iterations} iterations in {round(elapsed, 2)}s")
+    if iterations > 0:
+        print(f"steps/s: {round(iterations / max(elapsed, 1e-9), 2)}")
+        print(f"cell updates/s: {round(cell_steps / max(elapsed, 1e-9))}")
+    return simulation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run the simulation without a display")
+    parser.add_argument("config", help="path to the config file")
+    parser.add_argument("iterations", type=int, help="amount of iterations to run")
+    parser.add_argument("--dump-every", type=int, default=0, help="save the trail map every n iterations, 0 never")
+    parser.add_argument("--dump-dir", default="frames", help="directory for saved trail maps")
+    parser.add_argument("--dump-format", choices=["png", "npy"], default="png")
+    parser.add_argument("--stats-every", type=int, default=0, help="print stats every n iterations, 0 never")
+    parser.add_argument("--checkpoint-every", type=int, default=0,
+                        help="save a checkpoint every n iterations, 0 never")
+    parser.add_argument("--checkpoint-dir", default="checkpoints", help="directory for checkpoints")
+    parser.add_argument("--resume", default=None, help="checkpoint to start from")
+    parser.add_argument("--color", action="store_true", help="color saved trail maps with the color settings")
+    args = parser.parse_args()
+
+    run(DataAccessor(args.config), args.iterations, args.dump_every, args.dump_dir, args.dump_format,
+        args.stats_every, args.checkpoint_every, args.checkpoint_dir, args.resume,
+        args.color)
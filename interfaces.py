@@ -1,3 +1,38 @@
+import numpy as np
+
+PARAMETERS = (
+    "simulation_resolution_x",
+    "simulation_resolution_y",
+    "initial_circle_radius",
+    "initial_cells_amount",
+    "cells_spawn_rate",
+    "trail_decay_factor",
+    "trail_evaporation_factor",
+    "sensors_distance",
+    "sensors_size",
+    "sensors_angle_span",
+    "movement_distance",
+    "movement_rotation",
+)
+
+
+def resample_matrix(matrix, width, height):
+    """
+    nearest neighbour resample of the last two axes to height x width
+    """
+    rows = np.arange(height) * matrix.shape[-2] // height
+    columns = np.arange(width) * matrix.shape[-1] // width
+    return matrix[..., rows[:, None], columns[None, :]]
+
+
+def rescale_cells(cells, old_width, old_height, width, height):
+    """
+    moves cells (rows x, y, rot) in place so they keep their relative position on the resized matrix
+    """
+    cells[0] = cells[0].astype(np.int64) * width // old_width
+    cells[1] = cells[1].astype(np.int64) * height // old_height
+
+
 class Physarum:
     def __init__(self, *args, **kwargs):
         print("mother")
@@ -14,3 +49,37 @@ class Physarum:
 
     def iterate(self):
         pass
+
+    def configure(self, **parameters):
+        """
+        applies only the parameters that differ from the current ones, a new resolution goes through
+        resize so the trail map and the cells move with it. returns the changed parameters
+        """
+        changed = {name: value for name, value in parameters.items()
+                   if not np.array_equal(getattr(self, name, None), value)}
+        for name, value in changed.items():
+            if name not in ("simulation_resolution_x", "simulation_resolution_y"):
+                setattr(self, name, value)
+        if "simulation_resolution_x" in changed or "simulation_resolution_y" in changed:
+            self.resize(parameters.get("simulation_resolution_x", self.simulation_resolution_x),
+                        parameters.get("simulation_resolution_y", self.simulation_resolution_y))
+        return changed
+
+    def resize(self, width: int, height: int):
+        self.simulation_resolution_x = width
+        self.simulation_resolution_y = height
+
+    def get_stats(self):
+        return {}
+
+    def get_population(self):
+        return {}
+
+    def save_checkpoint(self, path: str):
+        raise NotImplementedError(f"{type(self).__module__} does not support checkpoints")
+
+    def load_checkpoint(self, path: str) -> int:
+        """
+        restores the state saved by save_checkpoint, returns the iteration it was saved at
+        """
+        raise NotImplementedError(f"{type(self).__module__} does not support checkpoints")
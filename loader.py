@@ -0,0 +1,130 @@
+from config import DataAccessor
+
+
+def load_class(__data_accessor: DataAccessor):
+    __simulation_resolution_x = __data_accessor.get_parameter("render_settings", "simulation_resolution_x")
+    __simulation_resolution_y = __data_accessor.get_parameter("render_settings", "simulation_resolution_y")
+
+    __initial_circle_radius = __data_accessor.get_parameter("initial_conditions", "initial_circle_radius")
+    __initial_cells_amount = __data_accessor.get_parameter("initial_conditions", "initial_cells_amount")
+    __cells_spawn_rate = __data_accessor.get_parameter("initial_conditions", "cells_spawn_rate")
+    __max_cells = __data_accessor.get_parameter("initial_conditions", "max_cells", default=0)
+    __trail_decay_factor = __data_accessor.get_parameter("initial_conditions", "trail_decay_factor")
+    __trail_evaporation_factor = __data_accessor.get_parameter("initial_conditions", "trail_evaporation_factor")
+
+    __sensors_distance = __data_accessor.get_parameter("cell_settings", "sensors_distance")
+    __sensors_size = __data_accessor.get_parameter("cell_settings", "sensors_size")
+    __sensors_angle_span = __data_accessor.get_parameter("cell_settings", "sensors_angle_span")
+    __movement_distance = __data_accessor.get_parameter("cell_settings", "movement_distance")
+    __movement_rotation = __data_accessor.get_parameter("cell_settings", "movement_rotation")
+    __deposit_amount = __data_accessor.get_parameter("cell_settings", "deposit_amount", default=255)
+
+    __sim_type = __data_accessor.get_parameter("program_settings", "simulation_type")
+    __simulation_threads = __data_accessor.get_parameter("program_settings", "simulation_threads", default=0)
+    __seed = __data_accessor.get_parameter("program_settings", "seed", default=-1)
+    __diffusion_mode = __data_accessor.get_parameter("initial_conditions", "diffusion_mode", default="box")
+    __diffusion_sigma = __data_accessor.get_parameter("initial_conditions", "diffusion_sigma", default=1.0)
+    __tile_size = __data_accessor.get_parameter("program_settings", "tile_size", default=0)
+    __simulation_workers = __data_accessor.get_parameter("program_settings", "simulation_workers", default=0)
+
+    def __build(__sim_type, __simulation_threads, __tile_size):
+        if __sim_type == "cpu":
+            import numba
+            from simulation_cpu import Physarum as Physarum_CPU
+            if __simulation_threads > 0:
+                numba.set_num_threads(min(__simulation_threads, numba.config.NUMBA_NUM_THREADS))
+            return Physarum_CPU(__simulation_resolution_x,
+                                __simulation_resolution_y,
+                                __initial_circle_radius,
+                                __initial_cells_amount,
+                                __cells_spawn_rate,
+                                __trail_decay_factor,
+                                __trail_evaporation_factor,
+                                __sensors_distance,
+                                __sensors_size,
+                                __sensors_angle_span,
+                                __movement_distance,
+                                __movement_rotation,
+                                __simulation_threads,
+                                __seed,
+                                __diffusion_mode,
+                                float(__diffusion_sigma),
+                                __tile_size,
+                                __max_cells,
+                                __deposit_amount
+                                )
+        elif __sim_type == "numpy":
+            from simulation_numpy import Physarum as Physarum_NumPy
+            return Physarum_NumPy(__simulation_resolution_x,
+                                  __simulation_resolution_y,
+                                  __initial_circle_radius,
+                                  __initial_cells_amount,
+                                  __cells_spawn_rate,
+                                  __trail_decay_factor,
+                                  __trail_evaporation_factor,
+                                  __sensors_distance,
+                                  __sensors_size,
+                                  __sensors_angle_span,
+                                  __movement_distance,
+                                  __movement_rotation,
+                                  __max_cells,
+                                  __seed,
+                                  __deposit_amount
+                                  )
+        elif __sim_type == "distributed":
+            from simulation_distributed import Physarum as Physarum_Distributed
+            return Physarum_Distributed(__simulation_resolution_x,
+                                        __simulation_resolution_y,
+                                        __initial_circle_radius,
+                                        __initial_cells_amount,
+                                        __cells_spawn_rate,
+                                        __trail_decay_factor,
+                                        __trail_evaporation_factor,
+                                        __sensors_distance,
+                                        __sensors_size,
+                                        __sensors_angle_span,
+                                        __movement_distance,
+                                        __movement_rotation,
+                                        __simulation_workers,
+                                        __seed,
+                                        __max_cells,
+                                        __tile_size if __tile_size > 0 else 64
+                                        )
+        else:
+            from simulation_gpu import Physarum as Physarum_GPU
+            return Physarum_GPU(__simulation_resolution_x,
+                                __simulation_resolution_y,
+                                __initial_circle_radius,
+                                __initial_cells_amount,
+                                __cells_spawn_rate,
+                                __trail_decay_factor,
+                                __trail_evaporation_factor,
+                                __sensors_distance,
+                                __sensors_size,
+                                __sensors_angle_span,
+                                __movement_distance,
+                                __movement_rotation
+                                )
+
+    if __sim_type == "auto":
+        from autotune import tune
+        __key = {"simulation_resolution_x": __simulation_resolution_x,
+                 "simulation_resolution_y": __simulation_resolution_y,
+                 "initial_cells_amount": __initial_cells_amount,
+                 "trail_decay_factor": __trail_decay_factor,
+                 "sensors_size": __sensors_size,
+                 "diffusion_mode": __diffusion_mode}
+        __cache_path = __data_accessor.get_parameter("program_settings", "autotune_cache",
+                                                     default="~/.cache/physarum/autotune.json")
+        __sim_type, __simulation_threads, __tile_size = tune(__build, __key, __cache_path)
+
+    __physarum = __build(__sim_type, __simulation_threads, __tile_size)
+
+    __physarum.profile = __data_accessor.get_parameter("program_settings", "profile", default=False)
+    __physarum.sensors_table_size = __data_accessor.get_parameter("program_settings", "sensors_table_size",
+                                                                  default=5)
+    __physarum.sort_interval = __data_accessor.get_parameter("program_settings", "sort_interval", default=0)
+    __physarum.target_step_time = __data_accessor.get_parameter("program_settings", "target_step_time", default=0.0)
+    __physarum.max_cell_age = __data_accessor.get_parameter("initial_conditions", "max_cell_age", default=0)
+
+    return __physarum
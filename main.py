@@ -7,16 +7,20 @@ import os
 import sys
 from datetime import datetime
 from config import DataAccessor
-from PIL import Image
 import time
 import signal
+from contextlib import nullcontext
+import numpy as np
 
 from mpl_toolkits.axes_grid1 import make_axes_locatable
-from matplotlib.colors import LinearSegmentedColormap
-import matplotlib as mpl
-from simulation_cpu import Physarum as Physarum_CPU
-from simulation_gpu import Physarum as Physarum_GPU
-from interfaces import Physarum
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import ListedColormap, Normalize
+from colormap import build_lut, apply_lut
+from interfaces import Physarum, PARAMETERS
+from loader import load_class
+from recorder import FrameRecorder, FfmpegRecorder
+from producer import SimulationProducer
+from frame_ring import FrameRingWriter
 
 
 class Renderer:
@@ -24,81 +28,51 @@ class Renderer:
         self.data_accessor = data_accessor
         signal.signal(signal.SIGINT, self.signal_handler)
         self.save = save = data_accessor.get_parameter("program_settings", "save_to_disk")
+        self.fps = data_accessor.get_parameter("program_settings", "record_fps")
+
+        self.record_mode = data_accessor.get_parameter("program_settings", "record_mode", default="png")
+        self.record_stride = data_accessor.get_parameter("program_settings", "record_stride", default=1)
+
         if self.save:
             self.output_dir = self.manage_output()
-
-        self.fps = data_accessor.get_parameter("program_settings", "record_fps")
+            if self.record_mode == "ffmpeg":
+                height, width = simulation.get_matrix().shape
+                self.recorder = FfmpegRecorder(f'sim_{self.output_dir}/sim.mp4', width, height, self.fps,
+                                               data_accessor.get_parameter("program_settings", "record_encoder",
+                                                                           default="libx264"),
+                                               data_accessor.get_parameter("program_settings", "record_ffmpeg",
+                                                                           default="ffmpeg"),
+                                               channels=3, stride=self.record_stride)
+            else:
+                self.recorder = FrameRecorder(f'sim_{self.output_dir}',
+                                              data_accessor.get_parameter("program_settings", "record_workers",
+                                                                          default=2),
+                                              data_accessor.get_parameter("program_settings", "record_queue_size",
+                                                                          default=32),
+                                              data_accessor.get_parameter("program_settings", "record_policy",
+                                                                          default="block"),
+                                              self.record_stride)
 
         self.simulation = simulation
         self.current_iter = 0
 
         self.im = None
-
-    def __cmap(self, __low_threshold,
-               __high_threshold,
-               __low_red,
-               __low_green,
-               __low_blue,
-               __high_red,
-               __high_green,
-               __high_blue):
-
-        __low_threshold = __low_threshold / 100
-        __high_threshold = __high_threshold / 100
-
-        __low_red = __low_red / 100
-        __low_green = __low_green / 100
-        __low_blue = __low_blue / 100
-
-        __high_red = __high_red / 100
-        __high_green = __high_green / 100
-        __high_blue = __high_blue / 100
-
-        _low_threshold = __high_threshold - 1 if __low_threshold >= __high_threshold else __low_threshold
-        __high_threshold = __low_threshold + 1 if __high_threshold <= __low_threshold else __high_threshold
-
-        __low_red = __high_red - 1 if __low_red >= __high_red else __low_red
-        __low_green = __high_green - 1 if __low_green >= __high_green else __low_green
-        __low_blue = __high_blue - 1 if __low_blue >= __high_blue else __low_blue
-
-        __high_red = __low_red + 1 if __high_red <= __low_red else __high_red
-        __high_green = __low_green + 1 if __high_green <= __low_green else __high_green
-        __high_blue = __low_blue + 1 if __high_blue <= __low_blue else __high_blue
-
-
-        __red_jump = (__high_threshold - __low_threshold) / (__high_red - __low_red)
-        __green_jump = (__high_threshold - __low_threshold) / (__high_green - __low_green)
-        __blue_jump = (__high_threshold - __low_threshold) / (__high_blue - __low_blue)
-
-
-        color_dict = {
-            'red': (
-                (0.0, 0.0, 0.0),
-                (__low_threshold, 0, 0),
-                (__low_threshold, 0, 0),
-                (__high_threshold, __red_jump, __red_jump),
-                (1, __red_jump, __red_jump),
-            ),
-            'green': (
-                (0.0, 0.0, 0.0),
-                (__low_threshold, 0, 0),
-                (__low_threshold, 0, 0),
-                (__high_threshold, __green_jump, __green_jump),
-                (1, __green_jump, __green_jump),
-            ),
-            'blue': (
-                (0.0, 0.0, 0.0),
-                (__low_threshold, 0, 0),
-                (__low_threshold, 0, 0),
-                (__high_threshold, __blue_jump, __blue_jump),
-                (1, __blue_jump, __blue_jump),
-            )
-        }
-
-        color_map = LinearSegmentedColormap("custom", color_dict)
-        mpl.colormaps.unregister("custom")
-        mpl.colormaps.register(color_map)
-
+        self.lut = None
+        self.rgb = None
+        self.record_rgb = None
+        self.pending_parameters = None
+        self.last_frame_time = None
+
+        self.ring = None
+        publish_ring = data_accessor.get_parameter("program_settings", "publish_ring", default="")
+        if publish_ring:
+            height, width = simulation.get_matrix().shape
+            self.ring = FrameRingWriter(publish_ring, height, width,
+                                        data_accessor.get_parameter("program_settings", "publish_slots", default=8))
+
+        self.producer = None
+        if data_accessor.get_parameter("program_settings", "simulation_producer", default=False):
+            self.producer = SimulationProducer(simulation, self.on_step if self.save or self.ring else None)
 
     def simulate(self):
 
@@ -113,19 +87,24 @@ class Renderer:
         __high_green = data_accessor.get_parameter("color_settings", "high_green")
         __high_blue = data_accessor.get_parameter("color_settings", "high_blue")
 
-        self.__cmap(__low_threshold, __high_threshold, __low_red, __low_green, __low_blue, __high_red, __high_green, __high_blue)
+        self.lut = build_lut(__low_threshold, __high_threshold, __low_red, __low_green, __low_blue, __high_red,
+                             __high_green, __high_blue)
 
         fig = plt.figure(num="physarum simulation", figsize=(15, 8))
         self.ax = fig.add_subplot(1, 1, 1)
         plt.subplots_adjust(left=0.5, right=0.9, top=0.9, bottom=0.1)
-        self.im = self.ax.imshow(self.simulation.get_matrix(), animated=True, interpolation='nearest', cmap="custom")
+        self.im = self.ax.imshow(self.colorize(self.simulation.get_matrix()), animated=True, interpolation='nearest')
         divider = make_axes_locatable(self.ax)
         cax = divider.append_axes('right', size='5%', pad=0.05)
-        fig.colorbar(self.im, cax=cax, orientation="vertical")
+        self.colorbar_mappable = ScalarMappable(Normalize(0, 255), ListedColormap(self.lut / 255))
+        fig.colorbar(self.colorbar_mappable, cax=cax, orientation="vertical")
         self.fps_val = self.ax.text(0.05, 1.05, "", transform=self.ax.transAxes, ha="center", fontsize=15)
         self.fps_val.set_path_effects([PathEffects.withStroke(linewidth=2, foreground='black')])
         self.ax.text(0.15, 1.05, "FPS", transform=self.ax.transAxes, ha="center", fontsize=15)
         self.title = self.ax.text(1, 1.05, "", transform=self.ax.transAxes, ha="right")
+        self.stats = self.ax.text(0.01, 0.01, "", transform=self.ax.transAxes, va="bottom", color="white",
+                                  fontsize=8, family="monospace")
+        self.stats.set_path_effects([PathEffects.withStroke(linewidth=2, foreground='black')])
 
         __simulation_resolution_x = data_accessor.get_parameter("render_settings", "simulation_resolution_x")
         __simulation_resolution_y = data_accessor.get_parameter("render_settings", "simulation_resolution_y")
@@ -380,11 +359,17 @@ class Renderer:
 
 
 
+        if self.producer is not None:
+            self.producer.start()
         ani = animation.FuncAnimation(fig, self.update_image, interval=1)
         plt.show()
 
+    def simulation_lock(self):
+        return self.producer.lock if self.producer is not None else nullcontext()
+
     def restart(self, *args, **kwargs):
-        self.simulation.restart()
+        with self.simulation_lock():
+            self.simulation.restart()
 
 
     def update_colormap(self, val):
@@ -397,44 +382,46 @@ class Renderer:
         __high_green = self.high_green_slider.val
         __high_blue = self.high_blue_slider.val
 
-        self.__cmap(__low_threshold, __high_threshold, __low_red, __low_green, __low_blue, __high_red, __high_green,
-                    __high_blue)
-
-        self.im.set_cmap("custom")
+        self.lut = build_lut(__low_threshold, __high_threshold, __low_red, __low_green, __low_blue, __high_red,
+                             __high_green, __high_blue)
+        self.colorbar_mappable.set_cmap(ListedColormap(self.lut / 255))
 
     def update(self, val):
-
-        self.set_parameter("simulation_resolution_x", int(self.simulation_resolution_x_slider.val))
-        self.set_parameter("simulation_resolution_y", int(self.simulation_resolution_y_slider.val))
-
-        self.set_parameter("initial_circle_radius", int(self.initial_circle_radius_slider.val))
-        self.set_parameter("initial_cells_amount", int(self.initial_cells_amount_slider.val))
-        self.set_parameter("cells_spawn_rate", int(self.cells_spawn_rate_slider.val))
-        self.set_parameter("trail_decay_factor", int(self.trail_decay_factor_slider.val))
-        self.set_parameter("trail_evaporation_factor", int(self.trail_evaporation_factor_slider.val))
-
-        self.set_parameter("sensors_distance", int(self.sensors_distance_slider.val))
-        self.set_parameter("sensors_size", int(self.sensors_size_slider.val))
-        self.set_parameter("movement_distance", int(self.movement_distance_slider.val))
-        self.set_parameter("movement_rotation", int(self.movement_rotation_slider.val))
-        self.set_parameter("sensors_angle_span", int(self.sensors_angle_span_slider.val))
-        self.simulation.iterate()
-
-    def set_parameter(self, name, value):
-        setattr(self.simulation, name, value)
+        """
+        slider events only queue the values, they are applied once before the next iteration
+        """
+        parameters = {name: int(getattr(self, f"{name}_slider").val) for name in PARAMETERS}
+        if self.producer is not None:
+            self.producer.configure(parameters)
+        else:
+            self.pending_parameters = parameters
 
     def update_image(self, i):
-        self.current_iter += 1
-        start = time.time()
-        self.simulation.iterate()
-        print(f"{round(time.time() - start, 2)}s")
-        self.im.set_array(self.simulation.get_matrix())
-
-        if self.save:
-            im = Image.fromarray(self.simulation.get_matrix())
-            im.save(f'sim_{self.output_dir}/frame_{str(self.current_iter).zfill(5)}.png')
-
-        fps = int(1.0 / (time.time() - start))
+        if self.producer is not None:
+            matrix = self.producer.latest()
+            if matrix is None:
+                return
+            self.current_iter = self.producer.iterations
+        else:
+            self.current_iter += 1
+            if self.pending_parameters is not None:
+                self.simulation.configure(**self.pending_parameters)
+                self.pending_parameters = None
+            self.simulation.iterate()
+            matrix = self.simulation.get_matrix()
+            if self.ring is not None:
+                self.ring.publish(matrix, self.current_iter, self.simulation.get_cells_amount())
+        frame = self.colorize(matrix)
+        if self.im.get_array().shape != frame.shape:
+            self.im.set_extent((-0.5, frame.shape[1] - 0.5, frame.shape[0] - 0.5, -0.5))
+        self.im.set_array(frame)
+
+        if self.save and self.producer is None:
+            self.recorder.record(frame, self.current_iter)
+
+        now = time.time()
+        fps = int(1.0 / max(now - self.last_frame_time, 1e-6)) if self.last_frame_time is not None else 0
+        self.last_frame_time = now
 
         if fps < 10:
             color = "red"
@@ -445,8 +432,44 @@ class Renderer:
 
         self.fps_val.set_text(f"{fps}")
         self.fps_val.set_color(color)
-        self.title.set_text(f"frame: {self.current_iter}  |  cells count: {self.simulation.get_cells_amount()}")
-        print(f"frame: {self.current_iter}  cells:{self.simulation.get_cells_amount()}")
+        title = f"frame: {self.current_iter}  |  cells count: {self.simulation.get_cells_amount()}"
+        if self.producer is not None:
+            title += f"  |  sim steps/s: {round(self.producer.steps_per_second(), 1)}"
+        if self.save:
+            title += f"  |  dropped frames: {self.recorder.dropped_frames}"
+        self.title.set_text(title)
+        self.stats.set_text(self.format_stats(self.simulation.get_stats(), self.simulation.get_population()))
+
+    def on_step(self, matrix, iteration):
+        """
+        publishes every iteration and records every record_stride-th one, called from the producer thread
+        """
+        if self.ring is not None:
+            self.ring.publish(matrix, iteration, self.simulation.get_cells_amount())
+        if self.save and self.recorder.due(iteration):
+            if self.record_rgb is None or self.record_rgb.shape[:2] != matrix.shape:
+                self.record_rgb = np.empty(matrix.shape + (3,), dtype=np.uint8)
+            self.recorder.record(apply_lut(matrix, self.lut, self.record_rgb), iteration)
+
+    def colorize(self, matrix):
+        """
+        rgb frame of the matrix through the lookup table, the buffer is reused while the resolution stays
+        """
+        if self.rgb is None or self.rgb.shape[:2] != matrix.shape:
+            self.rgb = np.empty(matrix.shape + (3,), dtype=np.uint8)
+        return apply_lut(matrix, self.lut, self.rgb)
+
+    @staticmethod
+    def format_stats(stats, population=None):
+        lines = []
+        if stats.get("iterations"):
+            lines = [f"{phase:<18}{round(duration * 1000, 2):>8} ms" for phase, duration in stats["phases"].items()]
+            lines.append(f"{'step':<18}{round(stats['step_time'] * 1000, 2):>8} ms")
+            lines += [f"{name:<18}{value:>11}" for name, value in stats["counters"].items()]
+        if population and population.get("limit") is not None:
+            lines.append(f"{'cells limit':<18}{population['limit']:>11}")
+            lines.append(f"{'cells retired':<18}{population['retired_total']:>11}")
+        return "\n".join(lines)
 
     @staticmethod
     def manage_output():
@@ -463,60 +486,21 @@ class Renderer:
 
     def signal_handler(self, sig, frame):
         print('You pressed Ctrl+C!')
-        os.system(
-            f"ffmpeg -framerate {self.fps} -i sim_{self.output_dir}/frame_%05d.png -c:v libx264 -vf fps=25 -pix_fmt yuv420p sim_{self.output_dir}/sim.mp4")
+        if self.producer is not None:
+            self.producer.stop()
+        if self.ring is not None:
+            self.ring.close()
+        if self.save:
+            returncode = self.recorder.close()
+            print(f"saved frames: {self.recorder.saved_frames}  dropped frames: {self.recorder.dropped_frames}")
+            if returncode:
+                print(f"ffmpeg exited with code {returncode}")
+        if self.save and self.record_mode != "ffmpeg":
+            os.system(
+                f"ffmpeg -framerate {self.fps} -i sim_{self.output_dir}/frame_%05d.png -c:v libx264 -vf fps=25 -pix_fmt yuv420p sim_{self.output_dir}/sim.mp4")
         sys.exit(0)
 
 
-def load_class(__data_accessor):
-    __simulation_resolution_x = data_accessor.get_parameter("render_settings", "simulation_resolution_x")
-    __simulation_resolution_y = data_accessor.get_parameter("render_settings", "simulation_resolution_y")
-
-    __initial_circle_radius = data_accessor.get_parameter("initial_conditions", "initial_circle_radius")
-    __initial_cells_amount = data_accessor.get_parameter("initial_conditions", "initial_cells_amount")
-    __cells_spawn_rate = data_accessor.get_parameter("initial_conditions", "cells_spawn_rate")
-    __trail_decay_factor = data_accessor.get_parameter("initial_conditions", "trail_decay_factor")
-    __trail_evaporation_factor = data_accessor.get_parameter("initial_conditions", "trail_evaporation_factor")
-
-    __sensors_distance = data_accessor.get_parameter("cell_settings", "sensors_distance")
-    __sensors_size = data_accessor.get_parameter("cell_settings", "sensors_size")
-    __sensors_angle_span = data_accessor.get_parameter("cell_settings", "sensors_angle_span")
-    __movement_distance = data_accessor.get_parameter("cell_settings", "movement_distance")
-    __movement_rotation = data_accessor.get_parameter("cell_settings", "movement_rotation")
-
-    __sim_type = data_accessor.get_parameter("program_settings", "simulation_type")
-    if __sim_type == "cpu":
-        __physarum = Physarum_CPU(__simulation_resolution_x,
-                                  __simulation_resolution_y,
-                                  __initial_circle_radius,
-                                  __initial_cells_amount,
-                                  __cells_spawn_rate,
-                                  __trail_decay_factor,
-                                  __trail_evaporation_factor,
-                                  __sensors_distance,
-                                  __sensors_size,
-                                  __sensors_angle_span,
-                                  __movement_distance,
-                                  __movement_rotation
-                                  )
-    else:
-        __physarum = Physarum_GPU(__simulation_resolution_x,
-                                  __simulation_resolution_y,
-                                  __initial_circle_radius,
-                                  __initial_cells_amount,
-                                  __cells_spawn_rate,
-                                  __trail_decay_factor,
-                                  __trail_evaporation_factor,
-                                  __sensors_distance,
-                                  __sensors_size,
-                                  __sensors_angle_span,
-                                  __movement_distance,
-                                  __movement_rotation
-                                  )
-
-    return __physarum
-
-
 if __name__ == "__main__":
     data_accessor = DataAccessor('config.json')
     physarum = load_class(data_accessor)
@@ -0,0 +1,139 @@
+import numpy as np
+
+
+def oldest_cells(births, amount):
+    """
+    sorted indices of the amount cells with the earliest births
+    """
+    if amount <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if amount >= len(births):
+        return np.arange(len(births))
+    return np.sort(np.argpartition(births, amount - 1)[:amount])
+
+
+def make_room(cells_array, births, cells_amount, amount, retire):
+    """
+    retires the oldest retire of the first cells_amount cells and makes room for amount new ones, returns
+    (cells_array, births, slots) with the arrays grown if needed and the slots the new cells go into.
+    the new cells take over the slots of the retired ones first, new cells beyond them are appended.
+    retired slots that are left over are filled with the last cells so the cells stay contiguous, only
+    then cells change their index. afterwards the first cells_amount + amount - retire cells are cells
+    """
+    retired = oldest_cells(births[:cells_amount], retire)
+    required = cells_amount + amount - len(retired)
+    capacity = cells_array.shape[1]
+    if required > capacity:
+        grown = np.zeros(shape=(cells_array.shape[0], max(2 * capacity, required)), dtype=cells_array.dtype)
+        grown[:, :cells_amount] = cells_array[:, :cells_amount]
+        cells_array = grown
+        grown = np.zeros(cells_array.shape[1], dtype=births.dtype)
+        grown[:cells_amount] = births[:cells_amount]
+        births = grown
+
+    if required >= cells_amount:
+        return cells_array, births, np.concatenate((retired, np.arange(cells_amount, required)))
+
+    holes = retired[retired < required]
+    movers = np.setdiff1d(np.arange(required, cells_amount), retired)
+    cells_array[:, holes[amount:]] = cells_array[:, movers]
+    births[holes[amount:]] = births[movers]
+    return cells_array, births, holes[:amount]
+
+
+class PopulationController:
+    def __init__(self, smoothing: float = 0.1, shrink_rate: float = 0.01):
+        """
+        decides how many cells an iteration spawns and how many of the oldest cells it retires so the
+        population stays within max_cells and the step time near target_step_time (seconds, 0 off).
+
+        the step time is modelled as a fixed cost for the matrix (evaporation, diffusion) plus a cost per
+        cell, both kept as exponential averages (smoothing) of the measured iterations. the cells that fit
+        into the target are (target - fixed cost) / cost per cell, never less than min_cells so a target
+        below the fixed cost keeps a small population instead of none. while the steps are too slow the
+        spawn rate is scaled down by target / step time, but below the limit at least one cell spawns.
+        above the limit at most shrink_rate of the cells (at least one) are retired per iteration, so one
+        slow frame does not wipe out the population. at the limit every spawned cell replaces one of the
+        oldest, cells older than max_cell_age iterations are always retired
+        """
+        self.smoothing = smoothing
+        self.shrink_rate = shrink_rate
+
+        self.step_time = 0.0
+        self.fixed_time = None
+        self.cell_time = None
+        self.cells_budget = None
+        self.limit = None
+        self.spawned = 0
+        self.retired = 0
+        self.expired = 0
+        self.retired_total = 0
+
+    def plan(self, births, iteration, cells_spawn_rate, max_cells, target_step_time, max_cell_age=0,
+             min_cells=0):
+        """
+        (cells to spawn, cells to retire) for the next iteration, births holds the iteration every
+        current cell was spawned in
+        """
+        cells_amount = len(births)
+        expired = 0
+        if max_cell_age > 0:
+            expired = int(np.count_nonzero(births <= iteration - max_cell_age))
+
+        spawn = cells_spawn_rate
+        if target_step_time > 0 and self.step_time > target_step_time:
+            spawn = int(spawn * target_step_time / self.step_time)
+
+        self.cells_budget = None
+        if target_step_time > 0 and self.cell_time:
+            self.cells_budget = max(int((target_step_time - self.fixed_time) / self.cell_time), min_cells)
+        limits = [max_cells] if max_cells > 0 else []
+        if self.cells_budget is not None:
+            limits.append(self.cells_budget)
+        self.limit = min(limits) if limits else None
+
+        retire = expired
+        if self.limit is not None:
+            excess = cells_amount + spawn - self.limit
+            if excess > 0:
+                retire = max(retire, min(excess, max(int(cells_amount * self.shrink_rate), 1)))
+        retire = min(retire, cells_amount)
+        if self.limit is None or cells_amount < self.limit:
+            spawn = max(spawn, min(cells_spawn_rate, 1))
+        if self.limit is not None:
+            spawn = min(spawn, self.limit - cells_amount + retire)
+        spawn = max(spawn, 0)
+
+        self.spawned = spawn
+        self.retired = retire
+        self.expired = expired
+        self.retired_total += retire
+        return spawn, retire
+
+    def record(self, step_time, cells_amount, fixed_time=0.0):
+        """
+        step_time of the last iteration, fixed_time is the part of it that does not depend on the cells
+        """
+        self.step_time = self.__average(self.step_time or None, step_time)
+        self.fixed_time = self.__average(self.fixed_time, fixed_time)
+        if cells_amount > 0:
+            self.cell_time = self.__average(self.cell_time, max(step_time - fixed_time, 0.0) / cells_amount)
+
+    def reset(self):
+        self.__init__(self.smoothing, self.shrink_rate)
+
+    def get_state(self):
+        return {
+            "step_time": self.step_time,
+            "fixed_time": self.fixed_time,
+            "cell_time": self.cell_time,
+            "cells_budget": self.cells_budget,
+            "limit": self.limit,
+            "spawned": self.spawned,
+            "retired": self.retired,
+            "expired": self.expired,
+            "retired_total": self.retired_total,
+        }
+
+    def __average(self, average, value):
+        return value if average is None else average + self.smoothing * (value - average)
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import numpy as np
+
+
+class SimulationProducer:
+    def __init__(self, simulation, on_step=None):
+        """
+        iterates the simulation in its own thread as fast as it can. the trail map is published into one
+        of two buffers, the renderer takes the latest one with latest() and keeps it until the next call,
+        the other buffer is only written again once the renderer has taken the published one, so the
+        renderer never sees a buffer that is being written and nothing is copied for it
+
+        on_step(matrix, iteration) is called from the thread after every iteration, e.g. for recording.
+        lock is held while the simulation iterates, take it before changing the simulation from outside.
+        configure() queues parameters that the thread applies before its next iteration, later calls
+        replace the queued parameters so a burst of slider events is applied once
+        """
+        self.simulation = simulation
+        self.on_step = on_step
+        self.lock = threading.Lock()
+        self.iterations = 0
+
+        self.__buffers = [None, None]
+        self.__front = 0
+        self.__published = False
+        self.__taken = True
+        self.__buffer_lock = threading.Lock()
+        self.__parameters = None
+        self.__running = False
+        self.__thread = None
+
+        self.__rate_iterations = 0
+        self.__rate_time = time.perf_counter()
+
+    def start(self):
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def configure(self, parameters: dict):
+        with self.__buffer_lock:
+            self.__parameters = parameters
+
+    def latest(self):
+        """
+        the most recent finished trail map, or None before the first one
+        """
+        with self.__buffer_lock:
+            self.__taken = True
+            return self.__buffers[self.__front] if self.__published else None
+
+    def steps_per_second(self):
+        """
+        iterations per second since the previous call
+        """
+        now = time.perf_counter()
+        iterations = self.iterations
+        rate = (iterations - self.__rate_iterations) / max(now - self.__rate_time, 1e-9)
+        self.__rate_iterations = iterations
+        self.__rate_time = now
+        return rate
+
+    def __run(self):
+        while self.__running:
+            with self.__buffer_lock:
+                parameters, self.__parameters = self.__parameters, None
+            with self.lock:
+                if parameters is not None:
+                    self.simulation.configure(**parameters)
+                self.simulation.iterate()
+                self.iterations += 1
+                matrix = self.simulation.get_matrix()
+                if self.on_step is not None:
+                    self.on_step(matrix, self.iterations)
+                if self.__taken:
+                    self.__publish(matrix)
+
+    def __publish(self, matrix):
+        back = 1 - self.__front
+        if self.__buffers[back] is None or self.__buffers[back].shape != matrix.shape:
+            self.__buffers[back] = np.empty_like(matrix)
+        np.copyto(self.__buffers[back], matrix)
+        with self.__buffer_lock:
+            self.__front = back
+            self.__published = True
+            self.__taken = False
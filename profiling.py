@@ -0,0 +1,42 @@
+import time
+
+
+class PhaseTimer:
+    def __init__(self):
+        """
+        durations of the phases of the last iteration, their totals over all profiled iterations
+        and counters of the work done by the last iteration
+        """
+        self.iterations = 0
+        self.phases = {}
+        self.totals = {}
+        self.counters = {}
+        self.__last = 0.0
+
+    def start(self):
+        """
+        phases are cleared so a phase the new iteration skips does not count with its old duration
+        """
+        self.iterations += 1
+        self.phases.clear()
+        self.__last = time.perf_counter()
+
+    def lap(self, phase: str, **counters):
+        now = time.perf_counter()
+        duration = now - self.__last
+        self.__last = now
+        self.phases[phase] = duration
+        self.totals[phase] = self.totals.get(phase, 0.0) + duration
+        self.counters.update(counters)
+
+    def reset(self):
+        self.__init__()
+
+    def get_stats(self):
+        return {
+            "iterations": self.iterations,
+            "step_time": sum(self.phases.values()),
+            "phases": dict(self.phases),
+            "totals": dict(self.totals),
+            "counters": dict(self.counters),
+        }
@@ -0,0 +1,127 @@
+import queue
+import subprocess
+import threading
+
+import numpy as np
+from PIL import Image
+
+
+class FrameRecorder:
+    def __init__(self, output_dir: str, workers: int = 2, queue_size: int = 32, policy: str = "block",
+                 stride: int = 1):
+        """
+        frames are copied into a bounded queue and saved as png by a pool of worker threads,
+        pillow releases the gil while compressing so the simulation keeps running.
+        only every stride-th iteration is recorded, as frame iteration // stride
+
+        policy "block" stalls the caller while the queue is full,
+        policy "drop" throws the frame away and counts it in dropped_frames
+        """
+        if policy not in ("block", "drop"):
+            raise ValueError(f"unknown record policy: {policy}")
+
+        self.output_dir = output_dir
+        self.policy = policy
+        self.stride = max(stride, 1)
+        self.dropped_frames = 0
+        self.saved_frames = 0
+
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__lock = threading.Lock()
+        self.__workers = [threading.Thread(target=self.__work, daemon=True) for _ in range(max(workers, 1))]
+        for worker in self.__workers:
+            worker.start()
+
+    def due(self, iteration: int):
+        return iteration % self.stride == 0
+
+    def record(self, matrix, iteration: int):
+        if not self.due(iteration):
+            return False
+        item = (iteration // self.stride, matrix.copy())
+        if self.policy == "block":
+            self.__queue.put(item)
+            return True
+        try:
+            self.__queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped_frames += 1
+            return False
+
+    def pending(self):
+        return self.__queue.qsize()
+
+    def close(self):
+        for _ in self.__workers:
+            self.__queue.put(None)
+        for worker in self.__workers:
+            worker.join()
+
+    def __work(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            frame_number, frame = item
+            Image.fromarray(frame).save(f'{self.output_dir}/frame_{str(frame_number).zfill(5)}.png')
+            with self.__lock:
+                self.saved_frames += 1
+
+
+class FfmpegRecorder:
+    def __init__(self, output_path: str, width: int, height: int, fps: int, encoder: str = "libx264",
+                 ffmpeg: str = "ffmpeg", channels: int = 1, stride: int = 1):
+        """
+        raw frames, gray or rgb for channels 3, are piped straight into an ffmpeg process that encodes
+        them while the simulation runs, a full pipe blocks the caller until ffmpeg catches up.
+        only every stride-th iteration is recorded. once ffmpeg is gone (bad encoder, disk full) frames
+        are counted as dropped and close() returns its exit code
+        """
+        self.width = width
+        self.height = height
+        self.stride = max(stride, 1)
+        self.returncode = None
+        self.shape = (height, width) if channels == 1 else (height, width, channels)
+        self.dropped_frames = 0
+        self.saved_frames = 0
+
+        command = [ffmpeg, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "gray" if channels == 1 else "rgb24",
+                   "-s", f"{width}x{height}", "-framerate", str(fps),
+                   "-i", "-",
+                   "-c:v", encoder, "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+                   output_path]
+        self.__process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def due(self, iteration: int):
+        return iteration % self.stride == 0
+
+    def record(self, matrix, iteration: int):
+        if not self.due(iteration):
+            return False
+        if matrix.shape != self.shape or self.__process.stdin.closed:
+            self.dropped_frames += 1
+            return False
+        try:
+            self.__process.stdin.write(np.ascontiguousarray(matrix, dtype=np.uint8).data)
+        except (BrokenPipeError, OSError):
+            self.dropped_frames += 1
+            self.__close_input()
+            return False
+        self.saved_frames += 1
+        return True
+
+    def pending(self):
+        return 0
+
+    def close(self):
+        self.__close_input()
+        self.returncode = self.__process.wait()
+        return self.returncode
+
+    def __close_input(self):
+        try:
+            self.__process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
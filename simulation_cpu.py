@@ -1,32 +1,533 @@
-from numba.experimental import jitclass
+import time
 
 import interfaces
-from numba import int32
-import numpy.random
 import numpy as np
 import numba
-import inspect
-
-spec = [
-    ('simulation_resolution_x', int32),
-    ('simulation_resolution_y', int32),
-    ('initial_circle_radius', int32),
-    ('initial_cells_amount', int32),
-    ('cells_spawn_rate', int32),
-    ('trail_decay_factor', int32),
-    ('trail_evaporation_factor', int32),
-    ('sensors_distance', int32),
-    ('sensors_size', int32),
-    ('sensors_angle_span', int32),
-    ('movement_distance', int32),
-    ('movement_rotation', int32),
-    ('__cells_array', numba.int32[:, :]),
-    ('__matrix', numba.uint8[:, :]),
-    ('__cells_amount', int32),
-]
-
-
-@jitclass(spec)
+from checkpoint import read_checkpoint, write_checkpoint
+from population import PopulationController, make_room
+from profiling import PhaseTimer
+
+# from this sensors_size on sensors are read from a summed area table, below it the direct reads are faster
+SENSORS_TABLE_SIZE = 5
+
+
+@numba.njit(cache=True)
+def build_direction_tables(sensors_distance, sensors_angle_span, movement_distance):
+    """
+    pixel offsets for every integer rotation in degrees
+    sensor_offsets[sensor, rot] is (x, y) of the left/front/right sensor
+    movement_offsets[rot] is (x, y) of one move
+    """
+    rot = np.arange(360)
+    sensor_offsets = np.empty((3, 360, 2), dtype=np.int32)
+    for sensor in range(3):
+        alpha = np.deg2rad(270 - rot - (sensors_angle_span * (sensor - 1)))
+        sensor_offsets[sensor, :, 0] = (sensors_distance * np.cos(alpha)).astype(np.int32)
+        sensor_offsets[sensor, :, 1] = (sensors_distance * np.sin(alpha)).astype(np.int32)
+
+    movement_offsets = np.empty((360, 2), dtype=np.int32)
+    alpha = np.deg2rad(270 - rot)
+    movement_offsets[:, 0] = (np.round(np.cos(alpha)) * movement_distance).astype(np.int32)
+    movement_offsets[:, 1] = (np.round(np.sin(alpha)) * movement_distance).astype(np.int32)
+    return sensor_offsets, movement_offsets
+
+
+@numba.njit(cache=True)
+def seed_streams(seed, streams):
+    """
+    independent xorshift64* states, one per stream, derived from seed with splitmix64
+    """
+    states = np.empty(streams, dtype=np.uint64)
+    z = np.uint64(seed)
+    for stream in range(streams):
+        z += np.uint64(0x9E3779B97F4A7C15)
+        x = z
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+        states[stream] = x if x != 0 else np.uint64(1)
+    return states
+
+
+@numba.njit(inline='always', cache=True)
+def _next_random(state):
+    state ^= state >> np.uint64(12)
+    state ^= state << np.uint64(25)
+    state ^= state >> np.uint64(27)
+    value = (state * np.uint64(0x2545F4914F6CDD1D)) >> np.uint64(11)
+    return state, value * (1.0 / 9007199254740992.0)
+
+
+@numba.njit(cache=True)
+def step_range(matrix, cells, start, stop, state,
+               simulation_resolution_x, simulation_resolution_y,
+               sensors_distance, sensors_size, sensor_offsets,
+               movement_offsets, movement_rotation, row_offset,
+               sensor_table=None, table_padding=0):
+    """
+    senses and moves the agents start to stop with the rng stream state,
+    returns the advanced state. with a sensor_table from build_sensor_table
+    every sensor is read with four lookups instead of sensors_size^2
+    """
+    offset = int(sensors_size / 2)
+    for i in range(start, stop):
+        pos_x = cells[0, i]
+        pos_y = cells[1, i]
+        rot = cells[2, i] % 360
+        if (pos_x >= simulation_resolution_x - sensors_distance or pos_x <= sensors_distance or
+                pos_y >= simulation_resolution_y - sensors_distance or pos_y <= sensors_distance):
+            pos_x = 0
+            pos_y = 0
+
+        left = 0
+        front = 0
+        right = 0
+        for sensor in range(3):
+            sensor_pos_x = pos_x + sensor_offsets[sensor, rot, 0] - offset
+            sensor_pos_y = pos_y + sensor_offsets[sensor, rot, 1] - offset
+            value = 0
+            if sensor_table is None:
+                for x in range(sensors_size):
+                    for y in range(sensors_size):
+                        value += matrix[sensor_pos_y + y - row_offset, sensor_pos_x + x]
+            else:
+                table_y = sensor_pos_y + table_padding
+                table_x = sensor_pos_x + table_padding
+                value = (sensor_table[table_y + sensors_size, table_x + sensors_size]
+                         - sensor_table[table_y, table_x + sensors_size]
+                         - sensor_table[table_y + sensors_size, table_x]
+                         + sensor_table[table_y, table_x])
+            if sensor == 0:
+                left = value
+            elif sensor == 1:
+                front = value
+            else:
+                right = value
+
+        state, multiply = _next_random(state)
+        angle = float(cells[2, i])
+        if left == front == right:
+            state, turn = _next_random(state)
+            angle = angle + np.round((turn * 2) - 1) * movement_rotation
+        elif left > right:
+            angle -= movement_rotation * multiply
+        elif left < right:
+            angle += movement_rotation * multiply
+
+        new_rot = int(angle)
+        cells[0, i] = pos_x + movement_offsets[new_rot % 360, 0]
+        cells[1, i] = pos_y + movement_offsets[new_rot % 360, 1]
+        cells[2, i] = new_rot
+    return state
+
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def step_agents(matrix, cells, cells_amount, rng_states,
+                simulation_resolution_x, simulation_resolution_y,
+                sensors_distance, sensors_size, sensor_offsets,
+                movement_offsets, movement_rotation, row_offset=0,
+                sensor_table=None, table_padding=0):
+    """
+    agents are split into one contiguous chunk per rng stream, every chunk is
+    advanced by one thread with its own stream, so the result only depends on
+    the seed and the amount of streams. the matrix is only read here, row
+    row_offset of the simulation is row 0 of matrix, sensor_table replaces
+    the reads of matrix when given
+    """
+    streams = len(rng_states)
+    chunk = (cells_amount + streams - 1) // streams
+    for stream in numba.prange(streams):
+        rng_states[stream] = step_range(matrix, cells, stream * chunk, min((stream + 1) * chunk, cells_amount),
+                                        rng_states[stream], simulation_resolution_x, simulation_resolution_y,
+                                        sensors_distance, sensors_size, sensor_offsets, movement_offsets,
+                                        movement_rotation, row_offset, sensor_table, table_padding)
+
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def build_sensor_table(matrix, table, padding):
+    """
+    summed area table of matrix wrapped around by padding pixels on every side, table[y, x] is the
+    sum of the padded matrix above and left of (y, x). a sensor square at (x, y) of size s sums to
+    t[y + p + s, x + p + s] - t[y + p, x + p + s] - t[y + p + s, x + p] + t[y + p, x + p]
+    """
+    height, width = matrix.shape
+    rows = table.shape[0] - 1
+    columns = table.shape[1] - 1
+    table[0, :] = 0
+    for row in numba.prange(rows):
+        y = (row - padding) % height
+        running_sum = 0
+        table[row + 1, 0] = 0
+        for column in range(columns):
+            running_sum += matrix[y, (column - padding) % width]
+            table[row + 1, column + 1] = running_sum
+
+    block = 256
+    for first in numba.prange((columns + block) // block):
+        for row in range(1, rows + 1):
+            for column in range(first * block, min((first + 1) * block, columns + 1)):
+                table[row, column] += table[row - 1, column]
+
+
+@numba.njit(nogil=True, cache=True)
+def box_blur(source, target, row_sums, column_sums, neighborhood_size):
+    """
+    mean of the (2r + 1)^2 neighbourhood divided by neighborhood_size^2, pixels
+    closer than r to the border are set to 0. uses running sums over rows and
+    columns, so the cost per pixel does not depend on neighborhood_size
+    """
+    radius = neighborhood_size // 2
+    size = 2 * radius + 1
+    divisor = neighborhood_size * neighborhood_size
+    height, width = source.shape
+
+    if height < size or width < size:
+        target[:, :] = 0
+        return
+
+    for y in range(height):
+        running_sum = 0
+        for x in range(size - 1):
+            running_sum += source[y, x]
+        for x in range(radius, width - radius):
+            running_sum += source[y, x + radius]
+            row_sums[y, x] = running_sum
+            running_sum -= source[y, x - radius]
+
+    column_sums[:] = 0
+    for y in range(size - 1):
+        for x in range(radius, width - radius):
+            column_sums[x] += row_sums[y, x]
+
+    target[:radius, :] = 0
+    target[height - radius:, :] = 0
+    for y in range(radius, height - radius):
+        for x in range(radius, width - radius):
+            column_sums[x] += row_sums[y + radius, x]
+            mean = column_sums[x] // divisor
+            target[y, x] = mean if mean < 255 else 255
+            column_sums[x] -= row_sums[y - radius, x]
+        target[y, :radius] = 0
+        target[y, width - radius:] = 0
+
+
+@numba.njit(cache=True)
+def _box_mean(source, target, row_sums, column_sums, radius):
+    """
+    rounded mean of the (2r + 1)^2 neighbourhood, pixels outside the matrix count as 0
+    """
+    size = 2 * radius + 1
+    divisor = size * size
+    height, width = source.shape
+
+    for y in range(height):
+        running_sum = 0
+        for x in range(min(radius, width)):
+            running_sum += source[y, x]
+        for x in range(width):
+            if x + radius < width:
+                running_sum += source[y, x + radius]
+            row_sums[y, x] = running_sum
+            if x - radius >= 0:
+                running_sum -= source[y, x - radius]
+
+    column_sums[:] = 0
+    for y in range(min(radius, height)):
+        for x in range(width):
+            column_sums[x] += row_sums[y, x]
+
+    for y in range(height):
+        for x in range(width):
+            if y + radius < height:
+                column_sums[x] += row_sums[y + radius, x]
+            target[y, x] = min((column_sums[x] + divisor // 2) // divisor, 255)
+            if y - radius >= 0:
+                column_sums[x] -= row_sums[y - radius, x]
+
+
+@numba.njit(nogil=True, cache=True)
+def gaussian_blur(source, target, row_sums, column_sums, sigma):
+    """
+    gaussian approximated with three box means (Kovesi), so the cost per pixel
+    does not depend on sigma. source is used as scratch, result lands in target
+    """
+    passes = 3
+    ideal_width = np.sqrt(12 * sigma * sigma / passes + 1)
+    lower_width = int(np.floor(ideal_width))
+    if lower_width % 2 == 0:
+        lower_width -= 1
+    upper_width = lower_width + 2
+    ideal_split = ((12 * sigma * sigma - passes * lower_width * lower_width - 4 * passes * lower_width - 3 * passes) /
+                   (-4 * lower_width - 4))
+    split = int(np.round(ideal_split))
+
+    for step in range(passes):
+        width = lower_width if step < split else upper_width
+        if step % 2 == 0:
+            _box_mean(source, target, row_sums, column_sums, (width - 1) // 2)
+        else:
+            _box_mean(target, source, row_sums, column_sums, (width - 1) // 2)
+
+
+@numba.njit(nogil=True, cache=True)
+def _diffuse_evaporate_tile(source, target, y0, y1, x0, x1, radius, divisor, evaporation, row_sums, column_sums):
+    """
+    one tile of diffuse_evaporate_tiled, computed from the evaporated source tile plus a halo of r pixels.
+    row_sums and column_sums are scratch of at least (tile + 2r, tile) and (tile,)
+    """
+    height, width = source.shape
+    target[y0:y1, x0:x1] = 0
+
+    inner_y0 = max(y0, radius)
+    inner_y1 = min(y1, height - radius)
+    inner_x0 = max(x0, radius)
+    inner_x1 = min(x1, width - radius)
+    if inner_y0 >= inner_y1 or inner_x0 >= inner_x1:
+        return
+
+    tile_width = inner_x1 - inner_x0
+    for row in range(inner_y1 - inner_y0 + 2 * radius):
+        y = inner_y0 - radius + row
+        running_sum = 0
+        for x in range(inner_x0 - radius, inner_x0 + radius):
+            value = source[y, x]
+            running_sum += value - evaporation if value > evaporation else 0
+        for column in range(tile_width):
+            value = source[y, inner_x0 + column + radius]
+            running_sum += value - evaporation if value > evaporation else 0
+            row_sums[row, column] = running_sum
+            value = source[y, inner_x0 + column - radius]
+            running_sum -= value - evaporation if value > evaporation else 0
+
+    column_sums[:tile_width] = 0
+    for row in range(2 * radius):
+        for column in range(tile_width):
+            column_sums[column] += row_sums[row, column]
+    for row in range(inner_y1 - inner_y0):
+        for column in range(tile_width):
+            column_sums[column] += row_sums[row + 2 * radius, column]
+            mean = column_sums[column] // divisor
+            target[inner_y0 + row, inner_x0 + column] = mean if mean < 255 else 255
+            column_sums[column] -= row_sums[row, column]
+
+
+def tile_scratch(tile_size, neighborhood_size, chunks=0):
+    """
+    row_sums and column_sums for diffuse_evaporate_tiled / diffuse_evaporate_active, one pair per chunk
+    of tiles, chunks defaults to the numba threads
+    """
+    chunks = chunks if chunks > 0 else numba.get_num_threads()
+    radius = neighborhood_size // 2
+    return (np.zeros(shape=(chunks, tile_size + 2 * radius, tile_size), dtype=np.int32),
+            np.zeros(shape=(chunks, tile_size), dtype=np.int32))
+
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def diffuse_evaporate_tiled(source, target, neighborhood_size, evaporation, tile_size, row_sums, column_sums):
+    """
+    evaporation followed by box_blur in a single pass. every tile of target is
+    computed from the evaporated source tile plus a halo of r pixels, so each
+    tile stays in cache and source is read only once. tiles run in parallel,
+    split round robin into one chunk per scratch buffer of tile_scratch.
+    the result is the same as evaporating source in place and then calling
+    box_blur, source itself is left untouched
+    """
+    radius = neighborhood_size // 2
+    divisor = neighborhood_size * neighborhood_size
+    height, width = source.shape
+    tiles_y = (height + tile_size - 1) // tile_size
+    tiles_x = (width + tile_size - 1) // tile_size
+    chunks = row_sums.shape[0]
+
+    for chunk in numba.prange(chunks):
+        for tile in range(chunk, tiles_y * tiles_x, chunks):
+            y0 = (tile // tiles_x) * tile_size
+            x0 = (tile % tiles_x) * tile_size
+            _diffuse_evaporate_tile(source, target, y0, min(y0 + tile_size, height), x0,
+                                    min(x0 + tile_size, width), radius, divisor, evaporation,
+                                    row_sums[chunk], column_sums[chunk])
+
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def diffuse_evaporate_active(source, target, neighborhood_size, evaporation, tile_size, source_active,
+                             target_active, row_sums, column_sums):
+    """
+    diffuse_evaporate_tiled restricted to the tiles that can hold trail. source_active marks the tiles
+    of source that may be non zero, a target tile without such a tile within r pixels stays 0 and is
+    only cleared when target_active says it still holds trail. target_active is updated to the tiles
+    of target that hold trail, the result equals the full sweep. returns the amount of computed tiles
+    """
+    radius = neighborhood_size // 2
+    divisor = neighborhood_size * neighborhood_size
+    height, width = source.shape
+    tiles_y, tiles_x = source_active.shape
+    reach = (radius + tile_size - 1) // tile_size
+    chunks = row_sums.shape[0]
+
+    computed = 0
+    for chunk in numba.prange(chunks):
+        for tile in range(chunk, tiles_y * tiles_x, chunks):
+            tile_y = tile // tiles_x
+            tile_x = tile % tiles_x
+            y0 = tile_y * tile_size
+            x0 = tile_x * tile_size
+            y1 = min(y0 + tile_size, height)
+            x1 = min(x0 + tile_size, width)
+
+            needed = False
+            for neighbour_y in range(max(tile_y - reach, 0), min(tile_y + reach + 1, tiles_y)):
+                for neighbour_x in range(max(tile_x - reach, 0), min(tile_x + reach + 1, tiles_x)):
+                    if source_active[neighbour_y, neighbour_x]:
+                        needed = True
+            if not needed:
+                if target_active[tile_y, tile_x]:
+                    target[y0:y1, x0:x1] = 0
+                    target_active[tile_y, tile_x] = False
+                continue
+
+            _diffuse_evaporate_tile(source, target, y0, y1, x0, x1, radius, divisor, evaporation,
+                                    row_sums[chunk], column_sums[chunk])
+            computed += 1
+            active = False
+            for y in range(y0, y1):
+                for x in range(x0, x1):
+                    if target[y, x] != 0:
+                        active = True
+                        break
+                if active:
+                    break
+            target_active[tile_y, tile_x] = active
+    return computed
+
+
+@numba.njit(nogil=True, cache=True)
+def mark_deposits(matrix, cells, cells_amount, active, tile_size):
+    """
+    flags the tiles deposit() writes into matrix. negative positions wrap around to the pixel first,
+    the tile of the wrapped pixel differs from the wrapped tile when the matrix is not a multiple of tile_size
+    """
+    height, width = matrix.shape
+    for i in range(cells_amount):
+        active[(cells[1, i] % height) // tile_size, (cells[0, i] % width) // tile_size] = True
+
+
+@numba.njit(nogil=True, cache=True)
+def deposit(matrix, cells, cells_amount):
+    """
+    sets the pixel under every agent to 255, positions outside the matrix wrap around like in the numpy engine
+    """
+    height, width = matrix.shape
+    for i in range(cells_amount):
+        matrix[cells[1, i] % height, cells[0, i] % width] = 255
+
+
+@numba.njit(nogil=True, cache=True)
+def deposit_add(matrix, cells, cells_amount, amount):
+    """
+    adds amount to the pixel under every agent, saturating at 255, amount 255 equals deposit()
+    """
+    height, width = matrix.shape
+    for i in range(cells_amount):
+        y, x = cells[1, i] % height, cells[0, i] % width
+        value = matrix[y, x] + amount
+        matrix[y, x] = value if value < 255 else 255
+
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def deposit_add_parallel(matrix, cells, cells_amount, amount, partials):
+    """
+    deposit_add in parallel. agents are split into one chunk per partial grid, every chunk counts
+    its hits per pixel in its own grid (saturating at 255), then the grids are summed into matrix
+    row by row and cleared for the next call
+    """
+    height, width = matrix.shape
+    chunks = partials.shape[0]
+    chunk = (cells_amount + chunks - 1) // chunks
+    for part in numba.prange(chunks):
+        grid = partials[part]
+        for i in range(part * chunk, min((part + 1) * chunk, cells_amount)):
+            y, x = cells[1, i] % height, cells[0, i] % width
+            if grid[y, x] < 255:
+                grid[y, x] += 1
+
+    for y in numba.prange(height):
+        hits = np.zeros(width, dtype=np.int32)
+        for part in range(chunks):
+            row = partials[part, y]
+            for x in range(width):
+                hits[x] += row[x]
+            row[:] = 0
+        for x in range(width):
+            value = matrix[y, x] + hits[x] * amount
+            matrix[y, x] = value if value < 255 else 255
+
+
+@numba.njit(inline='always', cache=True)
+def _spread_bits(value):
+    value &= 0xFFFF
+    value = (value | (value << 8)) & 0x00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F
+    value = (value | (value << 2)) & 0x33333333
+    value = (value | (value << 1)) & 0x55555555
+    return value
+
+
+@numba.njit(nogil=True, cache=True)
+def sort_cells_spatially(cells, cells_amount, scratch, order, scratch_order, births=None, births_scratch=None):
+    """
+    reorders the first cells_amount cells along a morton curve over (x, y) so agents close on the
+    matrix are close in memory. the morton key and the index of every cell are packed into one
+    uint64, an lsd radix sort with 8 bit digits over the key bits (one counting sort per digit,
+    between order and scratch_order) gives the new order, the cells are then gathered into scratch
+    once and copied back. stable, so cells on the same pixel keep their order. births, when given,
+    is reordered along with the cells
+    """
+    highest = 0
+    for i in range(cells_amount):
+        key = _spread_bits(max(cells[0, i], 0)) | (_spread_bits(max(cells[1, i], 0)) << 1)
+        order[i] = (np.uint64(key) << np.uint64(32)) | np.uint64(i)
+        highest = max(highest, key)
+
+    source, target = order, scratch_order
+    counts = np.empty(256, dtype=np.int64)
+    shift = 32
+    while shift == 32 or (highest >> (shift - 32)) > 0:
+        counts[:] = 0
+        for i in range(cells_amount):
+            counts[(source[i] >> np.uint64(shift)) & np.uint64(0xFF)] += 1
+        position = 0
+        for digit in range(256):
+            count = counts[digit]
+            counts[digit] = position
+            position += count
+        for i in range(cells_amount):
+            digit = (source[i] >> np.uint64(shift)) & np.uint64(0xFF)
+            target[counts[digit]] = source[i]
+            counts[digit] += 1
+        source, target = target, source
+        shift += 8
+
+    for row in range(3):
+        for i in range(cells_amount):
+            scratch[row, i] = cells[row, source[i] & np.uint64(0xFFFFFFFF)]
+    cells[:, :cells_amount] = scratch[:, :cells_amount]
+    if births is not None:
+        for i in range(cells_amount):
+            births_scratch[i] = births[source[i] & np.uint64(0xFFFFFFFF)]
+        births[:cells_amount] = births_scratch[:cells_amount]
+
+
+@numba.njit(nogil=True, cache=True)
+def evaporate(matrix, trail_evaporation_factor):
+    height, width = matrix.shape
+    for y in range(height):
+        for x in range(width):
+            if matrix[y, x] > trail_evaporation_factor:
+                matrix[y, x] = matrix[y, x] - trail_evaporation_factor
+            else:
+                matrix[y, x] = 0
+
+
 class Physarum(interfaces.Physarum):
     def __init__(self,
                  simulation_resolution_x: int,
@@ -40,7 +541,14 @@ class Physarum(interfaces.Physarum):
                  sensors_size: int,
                  sensors_angle_span: int,
                  movement_distance: int,
-                 movement_rotation: int
+                 movement_rotation: int,
+                 simulation_threads: int = 0,
+                 seed: int = -1,
+                 diffusion_mode: str = "box",
+                 diffusion_sigma: float = 1.0,
+                 tile_size: int = 0,
+                 max_cells: int = 0,
+                 deposit_amount: int = 255
                  ):
         self.simulation_resolution_x = simulation_resolution_x
         self.simulation_resolution_y = simulation_resolution_y
@@ -57,28 +565,63 @@ class Physarum(interfaces.Physarum):
         self.movement_distance = movement_distance
         self.movement_rotation = movement_rotation
 
+        self.simulation_threads = simulation_threads
+        self.seed = seed
+        self.diffusion_mode = diffusion_mode
+        self.diffusion_sigma = diffusion_sigma
+        self.tile_size = tile_size
+        self.max_cells = max_cells
+        self.deposit_amount = deposit_amount
+        self.sensors_table_size = SENSORS_TABLE_SIZE
+        self.sort_interval = 0
+        self.target_step_time = 0.0
+        self.max_cell_age = 0
+        self.__population = PopulationController()
+        self.__iteration = 0
+        self.__sort_scratch = None
+        self.__tile_scratch_parameters = None
+        self.profile = False
+        self.__timer = PhaseTimer()
+
+        self.__random = np.random.default_rng(self.seed if self.seed >= 0 else None)
+        self.__rng_states = seed_streams(self.__random.integers(0, 2 ** 62), max(self.simulation_threads, 1))
+
+        self.__tables_parameters = None
+        self.__update_direction_tables()
+
         self.__cells_amount = 0
-        self.__matrix = np.zeros(shape=(self.simulation_resolution_y, self.simulation_resolution_x), dtype=np.uint8)
-        self.__cells_array = self.__generate_cells(self.initial_cells_amount)
+        self.__allocate_matrix(self.simulation_resolution_x, self.simulation_resolution_y)
+        self.__cells_array = np.zeros(shape=(3, max(self.max_cells, self.initial_cells_amount, 1)), dtype=np.int32)
+        self.__cells_birth = np.zeros(self.__cells_array.shape[1], dtype=np.int64)
+        self.__spawn_cells(self.initial_cells_amount)
 
         self.iterate()
+        # the first iteration compiles, its step time would throw off the controller
+        self.__population.reset()
 
         """
         row 0 is cells x pos
         row 1 is cells y pos
         row 2 is cells rot
+
+        only the first __cells_amount columns are cells, the rest is spare capacity,
+        __cells_birth holds the iteration every cell was spawned in. a cell keeps its index unless
+        sort_interval reorders the cells or the population controller retires more cells than it
+        spawns, then the last cells move into the freed slots
+
+        __active_tiles flags the tile_size tiles of __matrix that may hold trail, None means unknown
+        and marks every tile on the next tiled iteration
         """
 
     def restart(self):
-        for y in range(self.simulation_resolution_y):
-            for x in range(self.simulation_resolution_x):
-                self.__matrix[y][x] = 0
+        self.__active_tiles = None
+        self.__matrix[:] = 0
         self.__cells_amount = 0
-        self.__cells_array = self.__generate_cells(self.initial_cells_amount)
-
+        self.__population.reset()
+        self.__spawn_cells(self.initial_cells_amount)
 
     def get_cells_array(self):
-        return self.__cells_array
+        return self.__cells_array[:, :self.__cells_amount]
 
     def get_cells_amount(self):
         return self.__cells_amount
@@ -86,127 +629,242 @@ class Physarum(interfaces.Physarum):
     def get_matrix(self):
         return self.__matrix
 
+    def get_population(self):
+        births = self.__cells_birth[:self.__cells_amount]
+        return dict(self.__population.get_state(),
+                    cells_amount=self.__cells_amount,
+                    max_cells=self.max_cells,
+                    target_step_time=self.target_step_time,
+                    max_cell_age=self.max_cell_age,
+                    oldest_cell_age=int(self.__iteration - births.min()) if len(births) else 0)
+
     def iterate(self):
-        self.__cells_array = np.concatenate((self.__cells_array, self.__generate_cells(self.cells_spawn_rate)),
-                                            axis=1)
-
-        for i in range(self.__cells_amount):
-            pos_x = self.__cells_array[0][i]
-            pos_y = self.__cells_array[1][i]
-            rot = self.__cells_array[2][i]
-            if not self.__check_bounds(pos_x, pos_y):
-                pos_x = 0
-                pos_y = 0
-            sensors_values = self.__calculate_sensors_values(pos_x, pos_y, rot)
-            new_rot = self.__calculate_rotation_angle(rot, sensors_values)
-            new_pos_x, new_pos_y = self.__calculate_cell_pos(pos_x, pos_y, new_rot)
-            self.__update_cell_params(i, new_pos_x, new_pos_y, new_rot)
-
-        self.__update_matrix()
-        self.__evaporate_cells()
-        self.__apply_gaussian_filter()
-
-    def __check_bounds(self, pos_x, pos_y):
-        if pos_x >= self.simulation_resolution_x - self.sensors_distance:
-            return False
-        elif pos_x <= self.sensors_distance:
-            return False
-        elif pos_y >= self.simulation_resolution_y - self.sensors_distance:
-            return False
-        elif pos_y <= self.sensors_distance:
-            return False
+        started = time.perf_counter()
+        if self.profile:
+            self.__timer.start()
+
+        self.__iteration += 1
+        self.__spawn_cells(*self.__population.plan(self.__cells_birth[:self.__cells_amount], self.__iteration,
+                                                   self.cells_spawn_rate, self.max_cells, self.target_step_time,
+                                                   self.max_cell_age, self.initial_cells_amount))
+        self.__update_direction_tables()
+        if len(self.__rng_states) != max(self.simulation_threads, 1):
+            self.__rng_states = seed_streams(self.__random.integers(0, 2 ** 62), max(self.simulation_threads, 1))
+        if self.profile:
+            self.__timer.lap("spawn")
+        self.__sort_cells()
+        if self.profile and self.sort_interval > 0:
+            self.__timer.lap("sort")
+
+        matrix_time = 0.0
+        if self.sensors_size >= self.sensors_table_size:
+            table_started = time.perf_counter()
+            padding = self.sensors_distance + self.sensors_size
+            shape = (self.__matrix.shape[0] + 2 * padding + 1, self.__matrix.shape[1] + 2 * padding + 1)
+            if self.__sensor_table is None or self.__sensor_table.shape != shape:
+                self.__sensor_table = np.zeros(shape=shape, dtype=np.int64)
+            build_sensor_table(self.__matrix, self.__sensor_table, padding)
+            matrix_time = time.perf_counter() - table_started
+            if self.profile:
+                self.__timer.lap("sensor_table")
+            step_agents(self.__matrix, self.__cells_array, self.__cells_amount, self.__rng_states,
+                        self.simulation_resolution_x, self.simulation_resolution_y,
+                        self.sensors_distance, self.sensors_size, self.__sensor_offsets,
+                        self.__movement_offsets, self.movement_rotation, 0, self.__sensor_table, padding)
         else:
-            return True
+            step_agents(self.__matrix, self.__cells_array, self.__cells_amount, self.__rng_states,
+                        self.simulation_resolution_x, self.simulation_resolution_y,
+                        self.sensors_distance, self.sensors_size, self.__sensor_offsets,
+                        self.__movement_offsets, self.movement_rotation)
+        if self.profile:
+            self.__timer.lap("agents", agents_processed=self.__cells_amount)
+
+        self.__deposit()
+        if self.profile:
+            self.__timer.lap("deposit", pixels_deposited=self.__cells_amount)
+
+        matrix_started = time.perf_counter()
+        if self.tile_size > 0 and self.diffusion_mode != "gaussian":
+            tiles = (-(-self.__matrix.shape[0] // self.tile_size), -(-self.__matrix.shape[1] // self.tile_size))
+            if self.__active_tiles is None or self.__active_tiles.shape != tiles:
+                self.__active_tiles = np.ones(tiles, dtype=np.bool_)
+                self.__back_active_tiles = np.ones(tiles, dtype=np.bool_)
+            mark_deposits(self.__matrix, self.__cells_array, self.__cells_amount, self.__active_tiles,
+                          self.tile_size)
+            scratch = (self.tile_size, self.trail_decay_factor, numba.get_num_threads())
+            if scratch != self.__tile_scratch_parameters:
+                self.__tile_row_sums, self.__tile_column_sums = tile_scratch(*scratch)
+                self.__tile_scratch_parameters = scratch
+            computed = diffuse_evaporate_active(self.__matrix, self.__back_matrix, self.trail_decay_factor,
+                                                self.trail_evaporation_factor, self.tile_size,
+                                                self.__active_tiles, self.__back_active_tiles,
+                                                self.__tile_row_sums, self.__tile_column_sums)
+            self.__matrix, self.__back_matrix = self.__back_matrix, self.__matrix
+            self.__active_tiles, self.__back_active_tiles = self.__back_active_tiles, self.__active_tiles
+            if self.profile:
+                self.__timer.lap("evaporate_diffuse", pixels_diffused=computed * self.tile_size ** 2,
+                                 active_tiles=computed)
+        else:
+            self.__active_tiles = None
+            evaporate(self.__matrix, self.trail_evaporation_factor)
+            if self.profile:
+                self.__timer.lap("evaporate", pixels_evaporated=self.__matrix.size)
+            self.__apply_gaussian_filter()
+            if self.profile:
+                self.__timer.lap("diffuse", pixels_diffused=self.__matrix.size)
+
+        finished = time.perf_counter()
+        self.__population.record(finished - started, self.__cells_amount, matrix_time + finished - matrix_started)
+
+    def resize(self, width: int, height: int):
+        old_height, old_width = self.__matrix.shape
+        matrix = interfaces.resample_matrix(self.__matrix, width, height)
+        self.__allocate_matrix(width, height)
+        self.__matrix[:] = matrix
+        interfaces.rescale_cells(self.get_cells_array(), old_width, old_height, width, height)
+        self.simulation_resolution_x = width
+        self.simulation_resolution_y = height
+
+    def get_stats(self):
+        return self.__timer.get_stats()
+
+    def save_checkpoint(self, path: str):
+        parameters = {name: getattr(self, name) for name in interfaces.PARAMETERS}
+        parameters.update(simulation_threads=self.simulation_threads,
+                          seed=self.seed,
+                          diffusion_mode=self.diffusion_mode,
+                          diffusion_sigma=self.diffusion_sigma,
+                          tile_size=self.tile_size,
+                          max_cells=self.max_cells,
+                          deposit_amount=self.deposit_amount)
+        write_checkpoint(path,
+                         {"matrix": self.__matrix,
+                          "cells": self.get_cells_array(),
+                          "births": self.__cells_birth[:self.__cells_amount],
+                          "rng_states": self.__rng_states},
+                         {"engine": "cpu",
+                          "parameters": parameters,
+                          "cells_amount": self.__cells_amount,
+                          "iteration": self.__iteration,
+                          "random_state": self.__random.bit_generator.state})
+
+    def load_checkpoint(self, path: str) -> int:
+        arrays, state = read_checkpoint(path, engine="cpu")
+        for name, value in state["parameters"].items():
+            setattr(self, name, value)
+        if self.simulation_threads > 0:
+            numba.set_num_threads(min(self.simulation_threads, numba.config.NUMBA_NUM_THREADS))
+
+        height, width = arrays["matrix"].shape
+        if self.__matrix.shape != (height, width):
+            self.__allocate_matrix(width, height)
+        self.__matrix[:] = arrays["matrix"]
+        self.__active_tiles = None
+
+        self.__cells_amount = state["cells_amount"]
+        self.__iteration = state.get("iteration", 0)
+        if self.__cells_array.shape[1] < self.__cells_amount:
+            self.__cells_array = np.zeros(shape=(3, max(self.max_cells, self.__cells_amount)), dtype=np.int32)
+        self.__cells_array[:, :self.__cells_amount] = arrays["cells"]
+        self.__cells_birth = np.zeros(self.__cells_array.shape[1], dtype=np.int64)
+        if "births" in arrays:
+            self.__cells_birth[:self.__cells_amount] = arrays["births"]
+        self.__population.reset()
+
+        if "rng_states" in arrays:
+            self.__rng_states = np.array(arrays["rng_states"])
+        if state["random_state"]["bit_generator"] == self.__random.bit_generator.state["bit_generator"]:
+            self.__random.bit_generator.state = state["random_state"]
+        return self.__iteration
+
+    def __allocate_matrix(self, width, height):
+        self.__active_tiles = None
+        self.__deposit_partials = None
+        self.__sensor_table = None
+        self.__matrix = np.zeros(shape=(height, width), dtype=np.uint8)
+        self.__back_matrix = np.zeros_like(self.__matrix)
+        self.__row_sums = np.zeros(shape=(height, width), dtype=np.int32)
+        self.__column_sums = np.zeros(width, dtype=np.int32)
+
+    def __deposit(self):
+        """
+        with many more agents than pixels per thread the hits are counted in one partial grid per thread
+        """
+        if self.deposit_amount >= 255:
+            deposit(self.__matrix, self.__cells_array, self.__cells_amount)
+        elif numba.get_num_threads() > 1 and self.__cells_amount >= self.__matrix.size // 2:
+            if self.__deposit_partials is None or len(self.__deposit_partials) != numba.get_num_threads():
+                self.__deposit_partials = np.zeros(shape=(numba.get_num_threads(),) + self.__matrix.shape,
+                                                   dtype=np.uint8)
+            deposit_add_parallel(self.__matrix, self.__cells_array, self.__cells_amount, self.deposit_amount,
+                                 self.__deposit_partials)
+        else:
+            deposit_add(self.__matrix, self.__cells_array, self.__cells_amount, self.deposit_amount)
+
+    def __sort_cells(self):
+        """
+        every sort_interval iterations the cells are reordered along a morton curve for cache locality
+        """
+        if self.sort_interval <= 0 or self.__iteration % self.sort_interval != 0:
+            return
+        capacity = self.__cells_array.shape[1]
+        if self.__sort_scratch is None or self.__sort_scratch.shape[1] != capacity:
+            self.__sort_scratch = np.empty_like(self.__cells_array)
+            self.__sort_order = np.empty(capacity, dtype=np.uint64)
+            self.__sort_scratch_order = np.empty(capacity, dtype=np.uint64)
+            self.__sort_births = np.empty(capacity, dtype=np.int64)
+        sort_cells_spatially(self.__cells_array, self.__cells_amount, self.__sort_scratch, self.__sort_order,
+                             self.__sort_scratch_order, self.__cells_birth, self.__sort_births)
+
+    def __update_direction_tables(self):
+        parameters = (self.sensors_distance, self.sensors_angle_span, self.movement_distance)
+        if parameters != self.__tables_parameters:
+            self.__sensor_offsets, self.__movement_offsets = build_direction_tables(*parameters)
+            self.__tables_parameters = parameters
 
     def __apply_gaussian_filter(self):
-        neighborhood_size = self.trail_decay_factor
-        result = np.zeros_like(self.__matrix, dtype=np.uint8)
-
-        radius = neighborhood_size // 2
-
-        for i in range(radius, self.simulation_resolution_y - radius):
-            for j in range(radius, self.simulation_resolution_x - radius):
-                # Compute mean of neighborhood
-                neighborhood_sum = 0
-                for ii in range(i - radius, i + radius + 1):
-                    for jj in range(j - radius, j + radius + 1):
-                        neighborhood_sum += self.__matrix[ii, jj]
-                mean = neighborhood_sum / (neighborhood_size ** 2)
-
-                # Set new pixel value
-                if mean > 255:
-                    mean = 255
-                if mean < 0:
-                    mean = 0
-                result[i, j] = int(mean)
-
-        self.__matrix = result.astype(np.uint8)
-
-    def __evaporate_cells(self):
-        for y in numba.prange(self.simulation_resolution_y):
-            for x in range(self.simulation_resolution_x):
-                if self.__matrix[y][x] > self.trail_evaporation_factor:
-                    self.__matrix[y][x] = self.__matrix[y][x] - self.trail_evaporation_factor
-                else:
-                    self.__matrix[y][x] = 0
-
-        """for y in range(self.__simulation_resolution_y):
-            for x in range(self.__simulation_resolution_x):
-                if self.__matrix[y][x] > self.__trail_evaporation_factor:
-                    self.__matrix[y][x] = self.__matrix[y][x] - self.__trail_evaporation_factor
-                else:
-                    self.__matrix[y][x] = 0"""
-
-    def __update_cell_params(self, i, pos_x, pos_y, rot):
-        self.__cells_array[0][i] = pos_x
-        self.__cells_array[1][i] = pos_y
-        self.__cells_array[2][i] = rot
-
-    def __calculate_cell_pos(self, pos_x, pos_y, rot):
-        alpha = np.deg2rad(270 - rot)
-        pos_x = int(pos_x + round(np.cos(alpha)) * self.movement_distance)
-        pos_y = int(pos_y + round(np.sin(alpha)) * self.movement_distance)
-        return pos_x, pos_y
-
-    def __calculate_rotation_angle(self, angle, sensors_values):
-        multiply = numpy.random.rand()
-        if sensors_values[0] == sensors_values[1] == sensors_values[2]:
-            angle = angle + np.round((numpy.random.rand() * 2) - 1) * self.movement_rotation
-        elif sensors_values[0] > sensors_values[2]:
-            angle -= self.movement_rotation * multiply
-        elif sensors_values[0] < sensors_values[2]:
-            angle += self.movement_rotation * multiply
-
-        return angle
-
-    def __calculate_sensors_values(self, pos_x: int, pos_y: int, rot: int):
-        sensors_values = [0, 0, 0]
-        offset = int(self.sensors_size / 2)
-        for sensor in range(3):
-            alpha = np.deg2rad(270 - rot - (self.sensors_angle_span * (sensor - 1)))
-            sensor_pos_x = pos_x + int(self.sensors_distance * np.cos(alpha))
-            sensor_pos_y = pos_y + int(self.sensors_distance * np.sin(alpha))
-            for x in range(self.sensors_size):
-                for y in range(self.sensors_size):
-                    sensors_values[sensor] += self.__matrix[sensor_pos_y + y - offset][sensor_pos_x + x - offset]
-        return sensors_values
-
-    def __update_matrix(self):
-        for i in range(len(self.__cells_array[0])):
-            self.__matrix[self.__cells_array[1][i]][self.__cells_array[0][i]] = 255
-
-    def __generate_cells(self, amount):
-        cells = np.zeros(shape=(3, amount), dtype=np.int32)
-
-        theta = np.random.uniform(0, 2 * np.pi, amount)
-        radius = np.random.uniform(0, self.initial_circle_radius, amount)
-        x = radius * np.cos(theta) + (self.simulation_resolution_x / 2)
-        y = radius * np.sin(theta) + (self.simulation_resolution_y / 2)
-        cells[0] = x
-        cells[1] = y
-        for i in range(len(cells[2])):
-            cells[2][i] = np.round(numpy.random.rand() * 360)
-
-        self.__cells_amount += amount
-
-        return cells
+        if self.diffusion_mode == "gaussian":
+            gaussian_blur(self.__matrix, self.__back_matrix, self.__row_sums, self.__column_sums,
+                          self.diffusion_sigma)
+        else:
+            box_blur(self.__matrix, self.__back_matrix, self.__row_sums, self.__column_sums,
+                     self.trail_decay_factor)
+        self.__matrix, self.__back_matrix = self.__back_matrix, self.__matrix
+
+    def __spawn_cells(self, amount, retire=0):
+        """
+        retires the oldest retire cells and spawns amount new ones into their slots, see population.make_room
+        """
+        if self.max_cells > 0:
+            amount = max(min(amount, self.max_cells - self.__cells_amount + retire), 0)
+
+        self.__cells_array, self.__cells_birth, slots = make_room(self.__cells_array, self.__cells_birth,
+                                                                  self.__cells_amount, amount, retire)
+
+        theta = self.__random.uniform(0, 2 * np.pi, amount)
+        radius = self.__random.uniform(0, self.initial_circle_radius, amount)
+        self.__cells_array[0, slots] = radius * np.cos(theta) + (self.simulation_resolution_x / 2)
+        self.__cells_array[1, slots] = radius * np.sin(theta) + (self.simulation_resolution_y / 2)
+        self.__cells_array[2, slots] = np.round(self.__random.random(amount) * 360)
+        self.__cells_birth[slots] = self.__iteration
+
+        self.__cells_amount += amount - retire
+
+
+def warmup():
+    """
+    compiles every kernel into the on-disk cache, later processes load them from there
+    """
+    for diffusion_mode, tile_size in (("box", 0), ("box", 8), ("gaussian", 0)):
+        simulation = Physarum(32, 32, 4, 16, 1, 3, 5, 3, 1, 30, 1, 55, 0, 0, diffusion_mode, 1.0, tile_size)
+        simulation.iterate()
+
+    # sensor table, added deposits and the spatial sort, the cells cover half the matrix for the parallel deposit
+    simulation = Physarum(32, 32, 12, 512, 1, 3, 5, 6, SENSORS_TABLE_SIZE, 30, 1, 55, 0, 0, "box", 1.0, 0,
+                          deposit_amount=64)
+    simulation.sort_interval = 1
+    simulation.iterate()
+    # which of the two the engine takes depends on the threads of this process, both are compiled directly
+    matrix, cells = simulation.get_matrix(), np.ascontiguousarray(simulation.get_cells_array())
+    deposit_add(matrix, cells, len(cells[0]), 64)
+    deposit_add_parallel(matrix, cells, len(cells[0]), 64, np.zeros(shape=(2,) + matrix.shape, dtype=np.uint8))
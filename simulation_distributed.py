@@ -0,0 +1,380 @@
+"""
+the trail matrix is split into horizontal strips, one worker process per strip. every strip lives in
+multiprocessing.shared_memory as two buffers (front and back) of its rows plus halo rows above and below,
+halo rows hold copies of the neighbouring strips so sensing and diffusion never leave the own block.
+
+one step of a worker:
+    sense and move its agents on the front buffer                         | barrier
+    deposit the moved agents into the front buffer of the owning strip,
+    reset agents out of bounds and post agents that left to their owner   | barrier
+    take the incoming agents, copy its edge rows into the neighbours halos| barrier
+    evaporate and diffuse front into back                                 | barrier
+    copy the edge rows of back into the neighbours halos and swap buffers
+
+the parent maps the same blocks and reads the trail matrix from the front buffers between steps,
+while it waits for the workers' replies nothing is written, so no frame goes through a pipe.
+
+the deposit only ever writes 255 so workers writing into the same strip can not conflict.
+agents that sense from out of bounds are reset to (0, 0) by step_agents, here this is done right after
+moving so that the agent is already owned by the first strip when it senses, unlike the single process
+engines the sensors of these agents and of agents at the top and bottom border see zeros instead of
+the rows wrapped around from the other side of the matrix.
+"""
+import multiprocessing
+import os
+import weakref
+from multiprocessing import shared_memory
+
+import numba
+import numpy as np
+
+import interfaces
+from checkpoint import read_checkpoint, write_checkpoint
+from simulation_cpu import build_direction_tables, diffuse_evaporate_tiled, seed_streams, step_agents, tile_scratch
+
+
+def halo_rows(trail_decay_factor, sensors_distance, sensors_size):
+    return max(trail_decay_factor // 2, sensors_distance + sensors_size, 1)
+
+
+def strip_bounds(height, workers, halo):
+    workers = max(min(workers, height // halo), 1)
+    return np.linspace(0, height, workers + 1).astype(np.int64)
+
+
+def _out_of_bounds(cells, parameters):
+    distance = parameters["sensors_distance"]
+    return ((cells[0] >= parameters["simulation_resolution_x"] - distance) | (cells[0] <= distance) |
+            (cells[1] >= parameters["simulation_resolution_y"] - distance) | (cells[1] <= distance))
+
+
+def _worker(index, bounds, halo, width, block_names, barrier, connection, inboxes, threads):
+    numba.set_num_threads(max(min(threads, numba.config.NUMBA_NUM_THREADS), 1))
+    workers = len(bounds) - 1
+    height = int(bounds[-1])
+    blocks = [shared_memory.SharedMemory(name=name) for name in block_names]
+    buffers = [np.ndarray((2, bounds[strip + 1] - bounds[strip] + 2 * halo, width), dtype=np.uint8,
+                          buffer=block.buf) for strip, block in enumerate(blocks)]
+    counts_block = shared_memory.SharedMemory(name=block_names[-1] + "_counts")
+    counts = np.ndarray((workers, workers), dtype=np.int64, buffer=counts_block.buf)
+    rows = bounds[index + 1] - bounds[index]
+    own = buffers[index]
+    front = 0
+
+    cells_array = np.zeros(shape=(3, 1), dtype=np.int32)
+    cells_amount = 0
+    rng_states = None
+    tables_parameters = None
+    sensor_offsets = movement_offsets = None
+    scratch_parameters = None
+    row_sums = column_sums = None
+
+    def append(cells):
+        nonlocal cells_array, cells_amount
+        required = cells_amount + cells.shape[1]
+        if required > cells_array.shape[1]:
+            grown = np.zeros(shape=(3, max(2 * cells_array.shape[1], required)), dtype=np.int32)
+            grown[:, :cells_amount] = cells_array[:, :cells_amount]
+            cells_array = grown
+        cells_array[:, cells_amount:required] = cells
+        cells_amount = required
+
+    def exchange(buffer):
+        # the first and last halo rows of the own strip go to the neighbours, at the border of the
+        # matrix there is no neighbour and the halo stays zero
+        if index > 0:
+            above = buffers[index - 1][buffer]
+            above[above.shape[0] - halo:] = own[buffer, halo:2 * halo]
+        if index < workers - 1:
+            buffers[index + 1][buffer, :halo] = own[buffer, rows:rows + halo]
+
+    while True:
+        command, *arguments = connection.recv()
+        if command == "stop":
+            break
+
+        elif command == "load":
+            strip, cells, seed = arguments
+            own[:] = 0
+            own[front, halo:halo + rows] = strip
+            cells_amount = 0
+            append(cells)
+            rng_states = seed_streams(seed, 1)
+            barrier.wait()
+            exchange(front)
+            barrier.wait()
+            connection.send(cells_amount)
+
+        elif command == "cells":
+            connection.send(cells_array[:, :cells_amount].copy())
+
+        elif command == "step":
+            parameters, spawned, tile_size = arguments
+            tile_size = tile_size if tile_size > 0 else max(own.shape[1:])
+            append(spawned)
+            table_parameters = (parameters["sensors_distance"], parameters["sensors_angle_span"],
+                                parameters["movement_distance"])
+            if table_parameters != tables_parameters:
+                sensor_offsets, movement_offsets = build_direction_tables(*table_parameters)
+                tables_parameters = table_parameters
+
+            step_agents(own[front], cells_array, cells_amount, rng_states,
+                        parameters["simulation_resolution_x"], parameters["simulation_resolution_y"],
+                        parameters["sensors_distance"], parameters["sensors_size"], sensor_offsets,
+                        movement_offsets, parameters["movement_rotation"], bounds[index] - halo)
+            barrier.wait()
+
+            cells = cells_array[:, :cells_amount]
+            rows_y = cells[1] % height
+            owners = np.searchsorted(bounds, rows_y, side='right') - 1
+            for strip in np.unique(owners):
+                selected = owners == strip
+                buffers[strip][front, rows_y[selected] - bounds[strip] + halo, cells[0, selected] % width] = 255
+
+            cells[:2, _out_of_bounds(cells, parameters)] = 0
+            owners = np.searchsorted(bounds, cells[1], side='right') - 1
+            counts[index] = np.bincount(owners, minlength=workers)
+            leaving = owners != index
+            if leaving.any():
+                for strip in np.flatnonzero(counts[index]):
+                    if strip != index:
+                        inboxes[strip].put((index, cells[:, owners == strip]))
+                staying = cells[:, ~leaving]
+                cells_amount = staying.shape[1]
+                cells_array[:, :cells_amount] = staying
+            barrier.wait()
+
+            arriving = counts[:, index].copy()
+            arriving[index] = 0
+            incoming = sorted((inboxes[index].get() for _ in range(np.count_nonzero(arriving))),
+                              key=lambda message: message[0])
+            for _, cells in incoming:
+                append(cells)
+            exchange(front)
+            barrier.wait()
+
+            radius = parameters["trail_decay_factor"] // 2
+            if (tile_size, parameters["trail_decay_factor"]) != scratch_parameters:
+                scratch_parameters = (tile_size, parameters["trail_decay_factor"])
+                row_sums, column_sums = tile_scratch(*scratch_parameters)
+            diffuse_evaporate_tiled(own[front], own[1 - front], parameters["trail_decay_factor"],
+                                    parameters["trail_evaporation_factor"], tile_size, row_sums, column_sums)
+            if index == 0:
+                own[1 - front, :halo + radius] = 0
+            if index == workers - 1:
+                own[1 - front, halo + rows - radius:] = 0
+            front = 1 - front
+            barrier.wait()
+            exchange(front)
+            connection.send(cells_amount)
+
+    for block in blocks + [counts_block]:
+        block.close()
+
+
+def _release(processes, connections, blocks, strips):
+    for connection in connections:
+        try:
+            connection.send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    # the parent's views of the strips have to go before their blocks can be closed
+    strips.clear()
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+class Physarum(interfaces.Physarum):
+    def __init__(self,
+                 simulation_resolution_x: int,
+                 simulation_resolution_y: int,
+                 initial_circle_radius: int,
+                 initial_cells_amount: int,
+                 cells_spawn_rate: int,
+                 trail_decay_factor: int,
+                 trail_evaporation_factor: int,
+                 sensors_distance: int,
+                 sensors_size: int,
+                 sensors_angle_span: int,
+                 movement_distance: int,
+                 movement_rotation: int,
+                 workers: int = 0,
+                 seed: int = -1,
+                 max_cells: int = 0,
+                 tile_size: int = 64
+                 ):
+        self.simulation_resolution_x = simulation_resolution_x
+        self.simulation_resolution_y = simulation_resolution_y
+
+        self.initial_circle_radius = initial_circle_radius
+        self.initial_cells_amount = initial_cells_amount
+        self.cells_spawn_rate = cells_spawn_rate
+        self.trail_decay_factor = trail_decay_factor
+        self.trail_evaporation_factor = trail_evaporation_factor
+
+        self.sensors_distance = sensors_distance
+        self.sensors_size = sensors_size
+        self.sensors_angle_span = sensors_angle_span
+        self.movement_distance = movement_distance
+        self.movement_rotation = movement_rotation
+
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.seed = seed
+        self.max_cells = max_cells
+        self.tile_size = tile_size
+        self.profile = False
+
+        self.__random = np.random.default_rng(self.seed if self.seed >= 0 else None)
+        self.__context = multiprocessing.get_context("spawn")
+        self.__finalizer = None
+        self.__cells_amount = 0
+        self.__iteration = 0
+        self.__matrix = np.zeros(shape=(self.simulation_resolution_y, self.simulation_resolution_x),
+                                 dtype=np.uint8)
+
+        self.__start(self.__matrix, self.__spawn_cells(self.initial_cells_amount))
+
+        self.iterate()
+
+        """
+        every worker keeps the cells of its strip, get_cells_array gathers them through the pipes, it is
+        only needed for checkpoints and resizing. get_matrix copies the front buffers of the strips from
+        shared memory into __matrix, __front follows the buffer swaps of the workers
+        """
+
+    def restart(self):
+        self.__matrix[:] = 0
+        self.__cells_amount = 0
+        self.__load(self.__matrix, self.__spawn_cells(self.initial_cells_amount))
+
+    def get_cells_array(self):
+        for connection in self.__connections:
+            connection.send(("cells",))
+        return np.concatenate([connection.recv() for connection in self.__connections], axis=1)
+
+    def get_cells_amount(self):
+        return self.__cells_amount
+
+    def get_matrix(self):
+        for strip, buffers in enumerate(self.__strips):
+            self.__matrix[self.__bounds[strip]:self.__bounds[strip + 1]] = \
+                buffers[self.__front, self.__halo:buffers.shape[1] - self.__halo]
+        return self.__matrix
+
+    def iterate(self):
+        parameters = {name: getattr(self, name) for name in interfaces.PARAMETERS}
+        if halo_rows(self.trail_decay_factor, self.sensors_distance, self.sensors_size) > self.__halo:
+            self.__start(self.get_matrix().copy(), self.get_cells_array())
+
+        spawned = self.__spawn_cells(self.cells_spawn_rate)
+        spawned[:2, _out_of_bounds(spawned, parameters)] = 0
+        owners = np.searchsorted(self.__bounds, spawned[1], side='right') - 1
+        for strip, connection in enumerate(self.__connections):
+            connection.send(("step", parameters, spawned[:, owners == strip], self.tile_size))
+        self.__cells_amount = sum(connection.recv() for connection in self.__connections)
+        self.__front = 1 - self.__front
+        self.__iteration += 1
+
+    def resize(self, width: int, height: int):
+        old_height, old_width = self.__matrix.shape
+        matrix = interfaces.resample_matrix(self.get_matrix(), width, height)
+        cells = self.get_cells_array()
+        interfaces.rescale_cells(cells, old_width, old_height, width, height)
+        self.simulation_resolution_x = width
+        self.simulation_resolution_y = height
+        self.__matrix = matrix
+        self.__start(self.__matrix, cells)
+
+    def close(self):
+        if self.__finalizer is not None:
+            self.__finalizer()
+
+    def save_checkpoint(self, path: str):
+        parameters = {name: getattr(self, name) for name in interfaces.PARAMETERS}
+        parameters.update(workers=self.workers,
+                          seed=self.seed,
+                          max_cells=self.max_cells,
+                          tile_size=self.tile_size)
+        write_checkpoint(path,
+                         {"matrix": self.get_matrix(),
+                          "cells": self.get_cells_array()},
+                         {"engine": "distributed",
+                          "parameters": parameters,
+                          "cells_amount": self.__cells_amount,
+                          "iteration": self.__iteration,
+                          "random_state": self.__random.bit_generator.state})
+
+    def load_checkpoint(self, path: str) -> int:
+        arrays, state = read_checkpoint(path, engine="distributed")
+        for name, value in state["parameters"].items():
+            setattr(self, name, value)
+        self.__random.bit_generator.state = state["random_state"]
+        self.__iteration = state.get("iteration", 0)
+        self.__matrix = np.array(arrays["matrix"])
+        self.__start(self.__matrix, np.array(arrays["cells"]))
+        return self.__iteration
+
+    def __start(self, matrix, cells):
+        """
+        (re)starts the workers for the current parameters and hands them matrix and cells
+        """
+        self.close()
+        height, width = matrix.shape
+        self.__halo = halo_rows(self.trail_decay_factor, self.sensors_distance, self.sensors_size)
+        self.__bounds = strip_bounds(height, self.workers, self.__halo)
+        workers = len(self.__bounds) - 1
+
+        blocks = [shared_memory.SharedMemory(create=True,
+                                             size=2 * (self.__bounds[strip + 1] - self.__bounds[strip] +
+                                                       2 * self.__halo) * width)
+                  for strip in range(workers)]
+        blocks.append(shared_memory.SharedMemory(create=True, size=workers * workers * 8,
+                                                 name=blocks[-1].name + "_counts"))
+        self.__strips = [np.ndarray((2, self.__bounds[strip + 1] - self.__bounds[strip] + 2 * self.__halo, width),
+                                    dtype=np.uint8, buffer=block.buf) for strip, block in enumerate(blocks[:-1])]
+        self.__front = 0
+        barrier = self.__context.Barrier(workers)
+        inboxes = [self.__context.Queue() for _ in range(workers)]
+        threads = max((os.cpu_count() or 1) // workers, 1)
+
+        self.__connections = []
+        processes = []
+        for strip in range(workers):
+            connection, worker_connection = self.__context.Pipe()
+            process = self.__context.Process(target=_worker, daemon=True,
+                                             args=(strip, self.__bounds, self.__halo, width,
+                                                   [block.name for block in blocks[:-1]], barrier,
+                                                   worker_connection, inboxes, threads))
+            process.start()
+            self.__connections.append(connection)
+            processes.append(process)
+        self.__finalizer = weakref.finalize(self, _release, processes, self.__connections, blocks,
+                                            self.__strips)
+
+        self.__load(matrix, cells)
+
+    def __load(self, matrix, cells):
+        cells = cells.copy()
+        cells[:2, _out_of_bounds(cells, {name: getattr(self, name) for name in interfaces.PARAMETERS})] = 0
+        owners = np.searchsorted(self.__bounds, cells[1], side='right') - 1
+        for strip, connection in enumerate(self.__connections):
+            connection.send(("load", matrix[self.__bounds[strip]:self.__bounds[strip + 1]],
+                             cells[:, owners == strip], self.__random.integers(0, 2 ** 62)))
+        self.__cells_amount = sum(connection.recv() for connection in self.__connections)
+
+    def __spawn_cells(self, amount):
+        if self.max_cells > 0:
+            amount = max(min(amount, self.max_cells - self.__cells_amount), 0)
+
+        cells = np.zeros(shape=(3, amount), dtype=np.int32)
+        theta = self.__random.uniform(0, 2 * np.pi, amount)
+        radius = self.__random.uniform(0, self.initial_circle_radius, amount)
+        cells[0] = radius * np.cos(theta) + (self.simulation_resolution_x / 2)
+        cells[1] = radius * np.sin(theta) + (self.simulation_resolution_y / 2)
+        cells[2] = np.round(self.__random.random(amount) * 360)
+        return cells
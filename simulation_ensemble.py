@@ -0,0 +1,219 @@
+"""
+K simulations of the same resolution advanced together. the trail matrices are one (K, H, W) array,
+the agents one (K, 3, capacity) array, sensors_angle_span, movement_rotation and trail_evaporation_factor
+are vectors with one value per member. one kernel call steps all members in parallel, so a sweep of
+hundreds of small simulations shares one process and one jit warmup.
+"""
+import itertools
+
+import numba
+import numpy as np
+
+import interfaces
+from simulation_cpu import box_blur, build_direction_tables, deposit, evaporate, seed_streams, step_range
+
+
+@numba.njit(parallel=True, cache=True)
+def step_members(matrices, back_matrices, row_sums, column_sums, cells, cells_amounts, rng_states,
+                 simulation_resolution_x, simulation_resolution_y, sensors_distance, sensors_size,
+                 sensor_offsets, movement_offsets, movement_rotation, trail_decay_factor,
+                 trail_evaporation_factor):
+    """
+    one full iteration of every member, result in back_matrices. members are split into one
+    contiguous chunk per row_sums scratch buffer, each member is simulated by a single thread
+    """
+    members = matrices.shape[0]
+    chunks = row_sums.shape[0]
+    chunk = (members + chunks - 1) // chunks
+    for scratch in numba.prange(chunks):
+        for member in range(scratch * chunk, min((scratch + 1) * chunk, members)):
+            rng_states[member] = step_range(matrices[member], cells[member], 0, cells_amounts[member],
+                                            rng_states[member], simulation_resolution_x,
+                                            simulation_resolution_y, sensors_distance, sensors_size,
+                                            sensor_offsets[member], movement_offsets[member],
+                                            movement_rotation[member], 0)
+            deposit(matrices[member], cells[member], cells_amounts[member])
+            evaporate(matrices[member], trail_evaporation_factor[member])
+            box_blur(matrices[member], back_matrices[member], row_sums[scratch], column_sums[scratch],
+                     trail_decay_factor)
+
+
+def parameter_grid(**values):
+    """
+    every combination of the given values, parameter_grid(movement_rotation=[30, 45], sensors_angle_span=[20, 40])
+    returns {"movement_rotation": [30, 30, 45, 45], "sensors_angle_span": [20, 40, 20, 40]}
+    """
+    names = list(values)
+    combinations = list(itertools.product(*(values[name] for name in names)))
+    return {name: [combination[index] for combination in combinations] for index, name in enumerate(names)}
+
+
+class Physarum(interfaces.Physarum):
+    def __init__(self,
+                 simulation_resolution_x: int,
+                 simulation_resolution_y: int,
+                 initial_circle_radius: int,
+                 initial_cells_amount: int,
+                 cells_spawn_rate: int,
+                 trail_decay_factor: int,
+                 trail_evaporation_factor,
+                 sensors_distance: int,
+                 sensors_size: int,
+                 sensors_angle_span,
+                 movement_distance: int,
+                 movement_rotation,
+                 members: int = 0,
+                 seed: int = -1,
+                 max_cells: int = 0
+                 ):
+        """
+        trail_evaporation_factor, sensors_angle_span and movement_rotation take one value for
+        every member or a single value shared by all, members defaults to the length of the vectors
+        """
+        vectors = {"trail_evaporation_factor": trail_evaporation_factor,
+                   "sensors_angle_span": sensors_angle_span,
+                   "movement_rotation": movement_rotation}
+        lengths = {len(value) for value in vectors.values() if np.ndim(value) == 1}
+        if len(lengths) > 1 or (lengths and members > 0 and lengths != {members}):
+            raise ValueError(f"parameter vectors need one value per member, got lengths {sorted(lengths)}")
+        self.members = members if members > 0 else (lengths.pop() if lengths else 1)
+
+        self.simulation_resolution_x = simulation_resolution_x
+        self.simulation_resolution_y = simulation_resolution_y
+
+        self.initial_circle_radius = initial_circle_radius
+        self.initial_cells_amount = initial_cells_amount
+        self.cells_spawn_rate = cells_spawn_rate
+        self.trail_decay_factor = trail_decay_factor
+        self.trail_evaporation_factor = np.broadcast_to(np.asarray(trail_evaporation_factor, dtype=np.int64),
+                                                        self.members).copy()
+
+        self.sensors_distance = sensors_distance
+        self.sensors_size = sensors_size
+        self.sensors_angle_span = np.broadcast_to(np.asarray(sensors_angle_span, dtype=np.float64),
+                                                  self.members).copy()
+        self.movement_distance = movement_distance
+        self.movement_rotation = np.broadcast_to(np.asarray(movement_rotation, dtype=np.float64),
+                                                 self.members).copy()
+
+        self.seed = seed
+        self.max_cells = max_cells
+        self.profile = False
+
+        self.__random = np.random.default_rng(self.seed if self.seed >= 0 else None)
+        self.__rng_states = seed_streams(self.__random.integers(0, 2 ** 62), self.members)
+
+        self.__tables_parameters = None
+        self.__update_direction_tables()
+
+        shape = (self.members, self.simulation_resolution_y, self.simulation_resolution_x)
+        self.__matrices = np.zeros(shape=shape, dtype=np.uint8)
+        self.__back_matrices = np.zeros_like(self.__matrices)
+        scratches = max(min(numba.get_num_threads(), self.members), 1)
+        self.__row_sums = np.zeros(shape=(scratches,) + shape[1:], dtype=np.int32)
+        self.__column_sums = np.zeros(shape=(scratches, self.simulation_resolution_x), dtype=np.int32)
+
+        self.__cells_amounts = np.zeros(self.members, dtype=np.int64)
+        self.__cells_array = np.zeros(shape=(self.members, 3, max(self.max_cells, self.initial_cells_amount, 1)),
+                                      dtype=np.int32)
+        self.__spawn_cells(self.initial_cells_amount)
+
+        self.iterate()
+
+        """
+        __cells_array[member] holds the cells of one member like the cpu engine,
+        the members all spawn the same amount so __cells_amounts only differ through max_cells
+        """
+
+    def restart(self):
+        self.__matrices[:] = 0
+        self.__cells_amounts[:] = 0
+        self.__spawn_cells(self.initial_cells_amount)
+
+    def get_cells_array(self, member: int = 0):
+        return self.__cells_array[member, :, :self.__cells_amounts[member]]
+
+    def get_cells_amount(self):
+        return int(self.__cells_amounts.sum())
+
+    def get_matrix(self, member: int = 0):
+        return self.__matrices[member]
+
+    def get_matrices(self):
+        return self.__matrices
+
+    def get_metrics(self):
+        """
+        one dict per member with its parameters, cells, mean trail and the share of pixels with trail
+        """
+        mean_trail = self.__matrices.mean(axis=(1, 2))
+        coverage = np.count_nonzero(self.__matrices, axis=(1, 2)) / self.__matrices[0].size
+        return [{"sensors_angle_span": float(self.sensors_angle_span[member]),
+                 "movement_rotation": float(self.movement_rotation[member]),
+                 "trail_evaporation_factor": int(self.trail_evaporation_factor[member]),
+                 "cells_amount": int(self.__cells_amounts[member]),
+                 "mean_trail": float(mean_trail[member]),
+                 "coverage": float(coverage[member])}
+                for member in range(self.members)]
+
+    def iterate(self):
+        self.__spawn_cells(self.cells_spawn_rate)
+        self.__update_direction_tables()
+
+        step_members(self.__matrices, self.__back_matrices, self.__row_sums, self.__column_sums,
+                     self.__cells_array, self.__cells_amounts, self.__rng_states,
+                     self.simulation_resolution_x, self.simulation_resolution_y,
+                     self.sensors_distance, self.sensors_size, self.__sensor_offsets,
+                     self.__movement_offsets, self.movement_rotation, self.trail_decay_factor,
+                     self.trail_evaporation_factor)
+        self.__matrices, self.__back_matrices = self.__back_matrices, self.__matrices
+
+    def configure(self, **parameters):
+        for name in ("trail_evaporation_factor", "sensors_angle_span", "movement_rotation"):
+            if name in parameters:
+                parameters[name] = np.broadcast_to(np.asarray(parameters[name], dtype=getattr(self, name).dtype),
+                                                   self.members).copy()
+        return super().configure(**parameters)
+
+    def resize(self, width: int, height: int):
+        old_height, old_width = self.__matrices.shape[1:]
+        self.__matrices = interfaces.resample_matrix(self.__matrices, width, height)
+        self.__back_matrices = np.zeros_like(self.__matrices)
+        self.__row_sums = np.zeros(shape=(self.__row_sums.shape[0], height, width), dtype=np.int32)
+        self.__column_sums = np.zeros(shape=(self.__column_sums.shape[0], width), dtype=np.int32)
+        for member in range(self.members):
+            interfaces.rescale_cells(self.get_cells_array(member), old_width, old_height, width, height)
+        self.simulation_resolution_x = width
+        self.simulation_resolution_y = height
+
+    def __update_direction_tables(self):
+        parameters = (self.sensors_distance, tuple(self.sensors_angle_span), self.movement_distance)
+        if parameters != self.__tables_parameters:
+            tables = [build_direction_tables(self.sensors_distance, span, self.movement_distance)
+                      for span in self.sensors_angle_span]
+            self.__sensor_offsets = np.stack([sensor_offsets for sensor_offsets, _ in tables])
+            self.__movement_offsets = np.stack([movement_offsets for _, movement_offsets in tables])
+            self.__tables_parameters = parameters
+
+    def __spawn_cells(self, amount):
+        amounts = np.full(self.members, amount, dtype=np.int64)
+        if self.max_cells > 0:
+            amounts = np.clip(self.max_cells - self.__cells_amounts, 0, amount)
+
+        required = int((self.__cells_amounts + amounts).max())
+        capacity = self.__cells_array.shape[2]
+        if required > capacity:
+            cells_array = np.zeros(shape=(self.members, 3, max(2 * capacity, required)), dtype=np.int32)
+            cells_array[:, :, :capacity] = self.__cells_array
+            self.__cells_array = cells_array
+
+        for member in np.flatnonzero(amounts):
+            start = self.__cells_amounts[member]
+            cells = self.__cells_array[member, :, start:start + amounts[member]]
+            theta = self.__random.uniform(0, 2 * np.pi, amounts[member])
+            radius = self.__random.uniform(0, self.initial_circle_radius, amounts[member])
+            cells[0] = radius * np.cos(theta) + (self.simulation_resolution_x / 2)
+            cells[1] = radius * np.sin(theta) + (self.simulation_resolution_y / 2)
+            cells[2] = np.round(self.__random.random(amounts[member]) * 360)
+
+        self.__cells_amounts += amounts
@@ -0,0 +1,342 @@
+import time
+
+import interfaces
+import numpy as np
+from checkpoint import read_checkpoint, write_checkpoint
+from population import PopulationController, make_room
+from profiling import PhaseTimer
+from simulation_cpu import SENSORS_TABLE_SIZE, build_direction_tables, sort_cells_spatially
+
+
+class Physarum(interfaces.Physarum):
+    def __init__(self,
+                 simulation_resolution_x: int,
+                 simulation_resolution_y: int,
+                 initial_circle_radius: int,
+                 initial_cells_amount: int,
+                 cells_spawn_rate: int,
+                 trail_decay_factor: int,
+                 trail_evaporation_factor: int,
+                 sensors_distance: int,
+                 sensors_size: int,
+                 sensors_angle_span: int,
+                 movement_distance: int,
+                 movement_rotation: int,
+                 max_cells: int = 0,
+                 seed: int = -1,
+                 deposit_amount: int = 255
+                 ):
+        self.simulation_resolution_x = simulation_resolution_x
+        self.simulation_resolution_y = simulation_resolution_y
+
+        self.initial_circle_radius = initial_circle_radius
+        self.initial_cells_amount = initial_cells_amount
+        self.cells_spawn_rate = cells_spawn_rate
+        self.trail_decay_factor = trail_decay_factor
+        self.trail_evaporation_factor = trail_evaporation_factor
+
+        self.sensors_distance = sensors_distance
+        self.sensors_size = sensors_size
+        self.sensors_angle_span = sensors_angle_span
+        self.movement_distance = movement_distance
+        self.movement_rotation = movement_rotation
+
+        self.max_cells = max_cells
+        self.seed = seed
+        self.deposit_amount = deposit_amount
+        self.sensors_table_size = SENSORS_TABLE_SIZE
+        self.sort_interval = 0
+        self.target_step_time = 0.0
+        self.max_cell_age = 0
+        self.__population = PopulationController()
+        self.__iteration = 0
+        self.__sort_scratch = None
+        self.profile = False
+        self.__timer = PhaseTimer()
+        self.__random = np.random.default_rng(self.seed if self.seed >= 0 else None)
+        self.__tables_parameters = None
+        self.__update_direction_tables()
+
+        self.__cells_amount = 0
+        self.__matrix = np.zeros(shape=(self.simulation_resolution_y, self.simulation_resolution_x), dtype=np.uint8)
+        self.__cells_array = np.zeros(shape=(3, max(self.max_cells, self.initial_cells_amount, 1)), dtype=np.int32)
+        self.__cells_birth = np.zeros(self.__cells_array.shape[1], dtype=np.int64)
+        self.__spawn_cells(self.initial_cells_amount)
+
+        self.iterate()
+        # the first iteration compiles, its step time would throw off the controller
+        self.__population.reset()
+
+        """
+        row 0 is cells x pos
+        row 1 is cells y pos
+        row 2 is cells rot
+
+        only the first __cells_amount columns are cells, the rest is spare capacity,
+        __cells_birth holds the iteration every cell was spawned in. a cell keeps its index unless
+        sort_interval reorders the cells or the population controller retires more cells than it
+        spawns, then the last cells move into the freed slots
+
+        same rules as simulation_cpu.Physarum, but every phase works on whole rows
+        of the cells array at once instead of looping over cells one by one
+        """
+
+    def restart(self):
+        self.__matrix[:] = 0
+        self.__cells_amount = 0
+        self.__population.reset()
+        self.__spawn_cells(self.initial_cells_amount)
+
+    def get_cells_array(self):
+        return self.__cells_array[:, :self.__cells_amount]
+
+    def get_cells_amount(self):
+        return self.__cells_amount
+
+    def get_matrix(self):
+        return self.__matrix
+
+    def get_population(self):
+        births = self.__cells_birth[:self.__cells_amount]
+        return dict(self.__population.get_state(),
+                    cells_amount=self.__cells_amount,
+                    max_cells=self.max_cells,
+                    target_step_time=self.target_step_time,
+                    max_cell_age=self.max_cell_age,
+                    oldest_cell_age=int(self.__iteration - births.min()) if len(births) else 0)
+
+    def iterate(self):
+        started = time.perf_counter()
+        if self.profile:
+            self.__timer.start()
+
+        self.__iteration += 1
+        self.__spawn_cells(*self.__population.plan(self.__cells_birth[:self.__cells_amount], self.__iteration,
+                                                   self.cells_spawn_rate, self.max_cells, self.target_step_time,
+                                                   self.max_cell_age, self.initial_cells_amount))
+        self.__update_direction_tables()
+        if self.profile:
+            self.__timer.lap("spawn")
+        self.__sort_cells()
+        if self.profile and self.sort_interval > 0:
+            self.__timer.lap("sort")
+
+        cells = self.__cells_array[:, :self.__cells_amount]
+        pos_x = cells[0]
+        pos_y = cells[1]
+        rot = cells[2]
+
+        out_of_bounds = ~self.__check_bounds(pos_x, pos_y)
+        pos_x[out_of_bounds] = 0
+        pos_y[out_of_bounds] = 0
+
+        sensors_values = self.__calculate_sensors_values(pos_x, pos_y, rot)
+        if self.profile:
+            self.__timer.lap("sensing", agents_processed=self.__cells_amount)
+
+        new_rot = self.__calculate_rotation_angle(rot, sensors_values).astype(np.int32)
+        new_pos_x, new_pos_y = self.__calculate_cell_pos(pos_x, pos_y, new_rot)
+
+        cells[0] = new_pos_x
+        cells[1] = new_pos_y
+        cells[2] = new_rot
+        if self.profile:
+            self.__timer.lap("moving")
+
+        self.__update_matrix()
+        if self.profile:
+            self.__timer.lap("deposit", pixels_deposited=self.__cells_amount)
+        matrix_started = time.perf_counter()
+        self.__evaporate_cells()
+        if self.profile:
+            self.__timer.lap("evaporate", pixels_evaporated=self.__matrix.size)
+        self.__apply_gaussian_filter()
+        if self.profile:
+            self.__timer.lap("diffuse", pixels_diffused=self.__matrix.size)
+
+        finished = time.perf_counter()
+        self.__population.record(finished - started, self.__cells_amount, finished - matrix_started)
+
+    def resize(self, width: int, height: int):
+        old_height, old_width = self.__matrix.shape
+        self.__matrix = interfaces.resample_matrix(self.__matrix, width, height)
+        interfaces.rescale_cells(self.get_cells_array(), old_width, old_height, width, height)
+        self.simulation_resolution_x = width
+        self.simulation_resolution_y = height
+
+    def get_stats(self):
+        return self.__timer.get_stats()
+
+    def save_checkpoint(self, path: str):
+        parameters = {name: getattr(self, name) for name in interfaces.PARAMETERS}
+        parameters.update(max_cells=self.max_cells, seed=self.seed, deposit_amount=self.deposit_amount)
+        write_checkpoint(path,
+                         {"matrix": self.__matrix,
+                          "cells": self.get_cells_array(),
+                          "births": self.__cells_birth[:self.__cells_amount]},
+                         {"engine": "numpy",
+                          "parameters": parameters,
+                          "cells_amount": self.__cells_amount,
+                          "iteration": self.__iteration,
+                          "random_state": self.__random.bit_generator.state})
+
+    def load_checkpoint(self, path: str) -> int:
+        arrays, state = read_checkpoint(path, engine="numpy")
+        for name, value in state["parameters"].items():
+            if name in interfaces.PARAMETERS or name in ("max_cells", "seed", "deposit_amount"):
+                setattr(self, name, value)
+
+        self.__matrix = np.array(arrays["matrix"])
+        self.__cells_amount = state["cells_amount"]
+        self.__iteration = state.get("iteration", 0)
+        self.__cells_array = np.zeros(shape=(3, max(self.max_cells, self.__cells_amount, 1)), dtype=np.int32)
+        self.__cells_array[:, :self.__cells_amount] = arrays["cells"]
+        self.__cells_birth = np.zeros(self.__cells_array.shape[1], dtype=np.int64)
+        if "births" in arrays:
+            self.__cells_birth[:self.__cells_amount] = arrays["births"]
+        self.__population.reset()
+
+        if state["random_state"]["bit_generator"] == self.__random.bit_generator.state["bit_generator"]:
+            self.__random.bit_generator.state = state["random_state"]
+        return self.__iteration
+
+    def __sort_cells(self):
+        """
+        every sort_interval iterations the cells are reordered along a morton curve for cache locality
+        """
+        if self.sort_interval <= 0 or self.__iteration % self.sort_interval != 0:
+            return
+        capacity = self.__cells_array.shape[1]
+        if self.__sort_scratch is None or self.__sort_scratch.shape[1] != capacity:
+            self.__sort_scratch = np.empty_like(self.__cells_array)
+            self.__sort_order = np.empty(capacity, dtype=np.uint64)
+            self.__sort_scratch_order = np.empty(capacity, dtype=np.uint64)
+            self.__sort_births = np.empty(capacity, dtype=np.int64)
+        sort_cells_spatially(self.__cells_array, self.__cells_amount, self.__sort_scratch, self.__sort_order,
+                             self.__sort_scratch_order, self.__cells_birth, self.__sort_births)
+
+    def __update_direction_tables(self):
+        parameters = (self.sensors_distance, self.sensors_angle_span, self.movement_distance)
+        if parameters != self.__tables_parameters:
+            self.__sensor_offsets, self.__movement_offsets = build_direction_tables(*parameters)
+            self.__tables_parameters = parameters
+
+    def __check_bounds(self, pos_x, pos_y):
+        return ((pos_x < self.simulation_resolution_x - self.sensors_distance) &
+                (pos_x > self.sensors_distance) &
+                (pos_y < self.simulation_resolution_y - self.sensors_distance) &
+                (pos_y > self.sensors_distance))
+
+    def __apply_gaussian_filter(self):
+        neighborhood_size = self.trail_decay_factor
+        radius = neighborhood_size // 2
+        height, width = self.__matrix.shape
+
+        result = np.zeros_like(self.__matrix)
+        if height <= 2 * radius or width <= 2 * radius:
+            self.__matrix = result
+            return
+
+        # summed area table with a leading row and column of zeros
+        table = np.zeros(shape=(height + 1, width + 1), dtype=np.int64)
+        np.cumsum(self.__matrix, axis=0, dtype=np.int64, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+
+        size = 2 * radius + 1
+        neighborhood_sum = (table[size:, size:] - table[:-size, size:] - table[size:, :-size] + table[:-size, :-size])
+        mean = neighborhood_sum // (neighborhood_size ** 2)
+        result[radius:height - radius, radius:width - radius] = np.minimum(mean, 255)
+
+        self.__matrix = result
+
+    def __evaporate_cells(self):
+        np.maximum(self.__matrix, self.trail_evaporation_factor, out=self.__matrix)
+        self.__matrix -= np.uint8(self.trail_evaporation_factor)
+
+    def __calculate_cell_pos(self, pos_x, pos_y, rot):
+        offsets = self.__movement_offsets[rot % 360]
+        return pos_x + offsets[:, 0], pos_y + offsets[:, 1]
+
+    def __calculate_rotation_angle(self, angle, sensors_values):
+        amount = len(angle)
+        multiply = self.__random.random(amount)
+        turn = np.round((self.__random.random(amount) * 2) - 1)
+        left, front, right = sensors_values
+
+        angle = angle.astype(np.float64)
+        equal = (left == front) & (front == right)
+        angle[equal] += turn[equal] * self.movement_rotation
+        turn_left = ~equal & (left > right)
+        angle[turn_left] -= self.movement_rotation * multiply[turn_left]
+        turn_right = ~equal & (left < right)
+        angle[turn_right] += self.movement_rotation * multiply[turn_right]
+
+        return angle
+
+    def __calculate_sensors_values(self, pos_x, pos_y, rot):
+        height, width = self.__matrix.shape
+        sensors_values = np.zeros(shape=(3, len(pos_x)), dtype=np.int64)
+        offset = int(self.sensors_size / 2)
+        rot = rot % 360
+        if self.sensors_size >= self.sensors_table_size:
+            return self.__calculate_sensors_values_from_table(pos_x, pos_y, rot)
+        for sensor in range(3):
+            offsets = self.__sensor_offsets[sensor][rot]
+            sensor_pos_x = pos_x + offsets[:, 0]
+            sensor_pos_y = pos_y + offsets[:, 1]
+            for x in range(self.sensors_size):
+                columns = (sensor_pos_x + x - offset) % width
+                for y in range(self.sensors_size):
+                    rows = (sensor_pos_y + y - offset) % height
+                    sensors_values[sensor] += self.__matrix[rows, columns]
+        return sensors_values
+
+    def __calculate_sensors_values_from_table(self, pos_x, pos_y, rot):
+        """
+        same values as the direct reads, from a summed area table of the matrix wrapped around by
+        sensors_distance + sensors_size pixels, four lookups per sensor whatever its size
+        """
+        size = self.sensors_size
+        padding = self.sensors_distance + size
+        padded = np.pad(self.__matrix, padding, mode='wrap')
+        table = np.zeros(shape=(padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.int64)
+        np.cumsum(padded, axis=0, dtype=np.int64, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+
+        sensors_values = np.zeros(shape=(3, len(pos_x)), dtype=np.int64)
+        for sensor in range(3):
+            offsets = self.__sensor_offsets[sensor][rot]
+            top = pos_y + offsets[:, 1] - int(size / 2) + padding
+            left = pos_x + offsets[:, 0] - int(size / 2) + padding
+            sensors_values[sensor] = (table[top + size, left + size] - table[top, left + size]
+                                      - table[top + size, left] + table[top, left])
+        return sensors_values
+
+    def __update_matrix(self):
+        height, width = self.__matrix.shape
+        cells = self.__cells_array[:, :self.__cells_amount]
+        if self.deposit_amount >= 255:
+            self.__matrix[cells[1] % height, cells[0] % width] = 255
+            return
+        hits = np.bincount((cells[1] % height) * width + (cells[0] % width), minlength=height * width)
+        matrix = self.__matrix.reshape(-1) + np.minimum(hits, 255) * self.deposit_amount
+        self.__matrix = np.minimum(matrix, 255).astype(np.uint8).reshape(height, width)
+
+    def __spawn_cells(self, amount, retire=0):
+        """
+        retires the oldest retire cells and spawns amount new ones into their slots, see population.make_room
+        """
+        if self.max_cells > 0:
+            amount = max(min(amount, self.max_cells - self.__cells_amount + retire), 0)
+
+        self.__cells_array, self.__cells_birth, slots = make_room(self.__cells_array, self.__cells_birth,
+                                                                  self.__cells_amount, amount, retire)
+
+        theta = self.__random.uniform(0, 2 * np.pi, amount)
+        radius = self.__random.uniform(0, self.initial_circle_radius, amount)
+        self.__cells_array[0, slots] = radius * np.cos(theta) + (self.simulation_resolution_x / 2)
+        self.__cells_array[1, slots] = radius * np.sin(theta) + (self.simulation_resolution_y / 2)
+        self.__cells_array[2, slots] = np.round(self.__random.random(amount) * 360)
+        self.__cells_birth[slots] = self.__iteration
+
+        self.__cells_amount += amount - retire
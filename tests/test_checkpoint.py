@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import interfaces
+import simulation_cpu
+import simulation_numpy
+
+
+ENGINES = {
+    "cpu": lambda seed, deposit_amount: simulation_cpu.Physarum(100, 80, 20, 200, 5, 3, 5, 3, 1, 30, 1, 45,
+                                                                seed=seed, deposit_amount=deposit_amount),
+    "numpy": lambda seed, deposit_amount: simulation_numpy.Physarum(100, 80, 20, 200, 5, 3, 5, 3, 1, 30, 1, 45,
+                                                                    seed=seed, deposit_amount=deposit_amount),
+}
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_resumed_run_matches_uninterrupted_run(engine, tmp_path):
+    simulation = ENGINES[engine](7, 100)
+    for _ in range(5):
+        simulation.iterate()
+    simulation.save_checkpoint(str(tmp_path))
+    for _ in range(10):
+        simulation.iterate()
+
+    resumed = ENGINES[engine](11, 255)
+    assert resumed.load_checkpoint(str(tmp_path)) == 6
+    assert resumed.deposit_amount == 100
+    for _ in range(10):
+        resumed.iterate()
+
+    assert np.array_equal(resumed.get_matrix(), simulation.get_matrix())
+    assert np.array_equal(resumed.get_cells_array(), simulation.get_cells_array())
+
+
+def test_checkpoint_of_another_engine_is_refused(tmp_path):
+    simulation_numpy.Physarum(100, 80, 20, 200, 5, 3, 5, 3, 1, 30, 1, 45).save_checkpoint(str(tmp_path))
+    simulation = simulation_cpu.Physarum(100, 80, 20, 200, 5, 3, 5, 3, 1, 30, 1, 45)
+    with pytest.raises(ValueError):
+        simulation.load_checkpoint(str(tmp_path))
+
+
+def test_engines_without_checkpoints_raise(tmp_path):
+    with pytest.raises(NotImplementedError):
+        interfaces.Physarum().save_checkpoint(str(tmp_path))
+    with pytest.raises(NotImplementedError):
+        interfaces.Physarum().load_checkpoint(str(tmp_path))
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+import simulation_cpu
+from simulation_cpu import (box_blur, build_direction_tables, build_sensor_table, deposit, diffuse_evaporate_active,
+                            diffuse_evaporate_tiled, evaporate, mark_deposits, seed_streams, step_agents, tile_scratch)
+
+SHAPES = [(64, 64), (83, 90), (37, 29)]
+
+
+def neighbourhood_mean(matrix, neighborhood_size):
+    """
+    the neighbourhood mean box_blur replaced, summed window by window
+    """
+    radius = neighborhood_size // 2
+    size = 2 * radius + 1
+    height, width = matrix.shape
+    result = np.zeros_like(matrix)
+    if height < size or width < size:
+        return result
+    sums = np.lib.stride_tricks.sliding_window_view(matrix.astype(np.int64), (size, size)).sum(axis=(2, 3))
+    result[radius:height - radius, radius:width - radius] = np.minimum(sums // neighborhood_size ** 2, 255)
+    return result
+
+
+def evaporate_blur(matrix, neighborhood_size, evaporation):
+    source = matrix.copy()
+    evaporate(source, evaporation)
+    target = np.zeros_like(source)
+    box_blur(source, target, np.zeros(source.shape, dtype=np.int32), np.zeros(source.shape[1], dtype=np.int32),
+             neighborhood_size)
+    return target
+
+
+def trail(shape, seed=1):
+    return np.random.default_rng(seed).integers(0, 256, size=shape, dtype=np.uint8)
+
+
+@pytest.mark.parametrize("shape", SHAPES + [(5, 40)])
+@pytest.mark.parametrize("neighborhood_size", [1, 2, 3, 4, 19])
+def test_box_blur_matches_neighbourhood_mean(shape, neighborhood_size):
+    matrix = trail(shape)
+    target = np.full_like(matrix, 7)
+    box_blur(matrix, target, np.zeros(shape, dtype=np.int32), np.zeros(shape[1], dtype=np.int32),
+             neighborhood_size)
+    assert np.array_equal(target, neighbourhood_mean(matrix, neighborhood_size))
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+@pytest.mark.parametrize("neighborhood_size, tile_size", [(1, 8), (3, 8), (4, 7), (19, 7), (19, 64)])
+def test_tiled_matches_evaporate_and_box_blur(shape, neighborhood_size, tile_size):
+    matrix = trail(shape)
+    target = np.full_like(matrix, 7)
+    diffuse_evaporate_tiled(matrix, target, neighborhood_size, 20, tile_size,
+                            *tile_scratch(tile_size, neighborhood_size))
+    assert np.array_equal(target, evaporate_blur(matrix, neighborhood_size, 20))
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+@pytest.mark.parametrize("neighborhood_size, tile_size", [(1, 8), (3, 8), (4, 7), (19, 7)])
+def test_active_matches_evaporate_and_box_blur(shape, neighborhood_size, tile_size):
+    tiles = (-(-shape[0] // tile_size), -(-shape[1] // tile_size))
+    source_active = np.zeros(tiles, dtype=np.bool_)
+    source_active[1, 2] = source_active[-1, -1] = True
+    matrix = trail(shape) * np.repeat(np.repeat(source_active, tile_size, 0), tile_size, 1)[:shape[0], :shape[1]]
+
+    target = np.full_like(matrix, 7)
+    target_active = np.ones(tiles, dtype=np.bool_)
+    diffuse_evaporate_active(matrix, target, neighborhood_size, 20, tile_size, source_active, target_active,
+                             *tile_scratch(tile_size, neighborhood_size))
+    expected = evaporate_blur(matrix, neighborhood_size, 20)
+    assert np.array_equal(target, expected)
+
+    holds_trail = np.zeros(tiles, dtype=np.bool_)
+    for tile_y, tile_x in np.argwhere(expected):
+        holds_trail[tile_y // tile_size, tile_x // tile_size] = True
+    assert np.array_equal(target_active, holds_trail)
+
+
+@pytest.mark.parametrize("shape", SHAPES[:2])
+@pytest.mark.parametrize("sensors_size", [simulation_cpu.SENSORS_TABLE_SIZE, 8])
+def test_table_sensors_match_direct_reads(shape, sensors_size):
+    sensors_distance = 6
+    height, width = shape
+    rng = np.random.default_rng(2)
+    matrix = trail(shape)
+    margin = sensors_distance + sensors_size + 1
+    cells = np.stack((rng.integers(margin, width - margin, 300), rng.integers(margin, height - margin, 300),
+                      rng.integers(0, 360, 300))).astype(np.int32)
+    sensor_offsets, movement_offsets = build_direction_tables(sensors_distance, 30, 1)
+
+    padding = sensors_distance + sensors_size
+    table = np.zeros((height + 2 * padding + 1, width + 2 * padding + 1), dtype=np.int64)
+    build_sensor_table(matrix, table, padding)
+
+    direct_cells, direct_states = cells.copy(), seed_streams(5, 2)
+    step_agents(matrix, direct_cells, 300, direct_states, width, height, sensors_distance, sensors_size,
+                sensor_offsets, movement_offsets, 45)
+    table_cells, table_states = cells.copy(), seed_streams(5, 2)
+    step_agents(matrix, table_cells, 300, table_states, width, height, sensors_distance, sensors_size,
+                sensor_offsets, movement_offsets, 45, 0, table, padding)
+    assert np.array_equal(table_cells, direct_cells)
+    assert np.array_equal(table_states, direct_states)
+
+
+def test_negative_positions_flag_the_tile_they_deposit_into():
+    matrix = np.zeros((83, 90), dtype=np.uint8)
+    cells = np.array([[-3], [-5], [0]], dtype=np.int32)
+    active = np.zeros((11, 12), dtype=np.bool_)
+    deposit(matrix, cells, 1)
+    mark_deposits(matrix, cells, 1, active, 8)
+    assert matrix[78, 87] == 255
+    assert np.array_equal(np.argwhere(active), [[78 // 8, 87 // 8]])
+
+    target = np.zeros_like(matrix)
+    diffuse_evaporate_active(matrix, target, 1, 5, 8, active, np.ones_like(active),
+                             *tile_scratch(8, 1))
+    assert target[78, 87] == 250
+
+
+@pytest.mark.parametrize("trail_decay_factor", [1, 3, 19])
+def test_tiled_engine_matches_separate_passes(trail_decay_factor):
+    def run(tile_size):
+        simulation = simulation_cpu.Physarum(101, 83, 20, 500, 20, trail_decay_factor, 5, 3, 1, 30, 5, 45,
+                                             1, 3, "box", 1.0, tile_size)
+        for _ in range(20):
+            simulation.iterate()
+        return simulation.get_matrix().copy()
+
+    assert np.array_equal(run(8), run(0))
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import simulation_cpu
+import simulation_numpy
+from population import PopulationController, make_room
+
+
+def test_retirement_is_capped_at_shrink_rate():
+    controller = PopulationController(shrink_rate=0.01)
+    spawn, retire = controller.plan(np.zeros(1000, dtype=np.int64), 1, 50, 500, 0.0)
+    assert retire == 10
+    assert spawn == 0
+
+
+def test_spawn_does_not_round_down_to_zero_below_the_limit():
+    controller = PopulationController()
+    controller.record(1.0, 1000, 0.5)
+    spawn, retire = controller.plan(np.zeros(0, dtype=np.int64), 1, 50, 0, 1e-5, min_cells=100)
+    assert controller.limit == 100
+    assert spawn >= 1
+    assert retire == 0
+
+
+def test_make_room_keeps_cells_contiguous():
+    cells = np.arange(30, dtype=np.int32).reshape(3, 10)
+    births = np.array([5, 0, 6, 1, 7, 8, 9, 2, 9, 9], dtype=np.int64)
+    cells, births, slots = make_room(cells, births, 10, 1, 3)
+    # the three oldest are 1, 3 and 7, the new cell takes slot 1 and the last cells fill 3 and 7
+    assert list(slots) == [1]
+    assert list(cells[0, :8]) == [0, 1, 2, 8, 4, 5, 6, 9]
+    assert list(births[[0, 2, 3, 4, 5, 6, 7]]) == [5, 6, 9, 7, 8, 9, 9]
+
+
+@pytest.mark.parametrize("engine", [simulation_cpu, simulation_numpy])
+def test_unreachable_budget_keeps_a_population(engine):
+    simulation = engine.Physarum(200, 150, 30, 1000, 50, 3, 5, 3, 1, 30, 1, 45)
+    simulation.target_step_time = 1e-5
+    for _ in range(50):
+        simulation.iterate()
+    assert simulation.get_cells_amount() >= 1000
+    assert simulation.get_population()["limit"] == 1000
+
+    simulation.target_step_time = 0.0
+    for _ in range(5):
+        simulation.iterate()
+    assert simulation.get_cells_amount() > 1000
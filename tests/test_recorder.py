@@ -0,0 +1,45 @@
+import os
+import stat
+import sys
+
+import numpy as np
+import pytest
+
+from recorder import FfmpegRecorder
+
+
+def write_stub(path, body):
+    """
+    an executable standing in for ffmpeg, the output file is its last argument
+    """
+    with open(path, 'w') as file:
+        file.write(f"#!{sys.executable}\nimport sys\n{body}\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the stub is started through its shebang")
+def test_frames_are_piped_every_stride_iterations(tmp_path):
+    stub = write_stub(tmp_path / "ffmpeg", "data = sys.stdin.buffer.read()\n"
+                                           "open(sys.argv[-1], 'w').write(str(len(data)))")
+    output = tmp_path / "sim.mp4"
+    recorder = FfmpegRecorder(str(output), 4, 3, 25, ffmpeg=stub, stride=3)
+    for iteration in range(10):
+        recorder.record(np.full((3, 4), iteration, dtype=np.uint8), iteration)
+
+    assert recorder.close() == 0
+    assert recorder.saved_frames == 4
+    assert recorder.dropped_frames == 0
+    assert output.read_text() == str(4 * 3 * 4)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the stub is started through its shebang")
+def test_dead_encoder_drops_frames_and_reports_its_exit_code(tmp_path):
+    stub = write_stub(tmp_path / "ffmpeg", "sys.exit(7)")
+    recorder = FfmpegRecorder(str(tmp_path / "sim.mp4"), 200, 200, 25, ffmpeg=stub)
+    for iteration in range(50):
+        recorder.record(np.zeros((200, 200), dtype=np.uint8), iteration)
+
+    assert recorder.close() == 7
+    assert recorder.dropped_frames > 0
+    assert recorder.saved_frames + recorder.dropped_frames == 50
@@ -0,0 +1,9 @@
+import time
+
+import simulation_cpu
+
+
+if __name__ == "__main__":
+    start = time.time()
+    simulation_cpu.warmup()
+    print(f"kernels compiled and cached in {round(time.time() - start, 2)}s")